@@ -0,0 +1,104 @@
+"""
+Compact activity series used by collect_data.py.
+
+Days are integer ordinals, the number of days since 1970-01-01 (UTC) as computed by SQLite with `date / 86400`. They are only turned
+into 'YYYY-MM-DD' strings when the stats are saved. Hours are ordinals the same way, `date / 3600`.
+"""
+
+import numpy as np
+from datetime import date, timedelta
+
+
+EPOCH_DAY = date(1970, 1, 1)
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday, weekdays start on Monday.
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+def day_to_str(day: int) -> str:
+    return (EPOCH_DAY + timedelta(days=int(day))).isoformat()
+
+
+class DailySeries:
+    """
+    Number of messages sent per day, as an int32 array covering every day from the first active day to the last one.
+    Supports the parts of the Counter interface used for `daily_message_counter`: `len()` is the number of active days.
+    """
+
+    __slots__ = ('start', 'counts')
+
+    def __init__(self):
+        self.start = 0  # Ordinal of the day of counts[0].
+        self.counts = np.zeros(0, dtype=np.int32)
+
+    def _cover(self, first_day: int, last_day: int):
+        """Grows the array so it covers every day from `first_day` to `last_day`."""
+        if not len(self.counts):
+            self.start = first_day
+            self.counts = np.zeros(last_day - first_day + 1, dtype=np.int32)
+            return
+
+        start = min(first_day, self.start)
+        end = max(last_day + 1, self.start + len(self.counts))
+
+        if start != self.start or end - start != len(self.counts):
+            counts = np.zeros(end - start, dtype=np.int32)
+            counts[self.start - start:self.start - start + len(self.counts)] = self.counts
+            self.start = start
+            self.counts = counts
+
+    def add(self, days, counts):
+        """Adds `counts[i]` messages on the day `days[i]`."""
+        days = np.asarray(days, dtype=np.int64)
+        if not len(days):
+            return
+
+        self._cover(int(days.min()), int(days.max()))
+        np.add.at(self.counts, days - self.start, np.asarray(counts, dtype=np.int32))
+
+    def update(self, other: 'DailySeries'):
+        if not len(other.counts):
+            return
+
+        self._cover(other.start, other.start + len(other.counts) - 1)
+        offset = other.start - self.start
+        self.counts[offset:offset + len(other.counts)] += other.counts
+
+    def __len__(self):
+        return int(np.count_nonzero(self.counts))
+
+    def first_day(self) -> int:
+        return self.start + int(np.flatnonzero(self.counts)[0])
+
+    def last_day(self) -> int:
+        return self.start + int(np.flatnonzero(self.counts)[-1])
+
+    def span(self) -> int:
+        """Number of days between the first and the last active day, 0 without any activity."""
+        active = np.flatnonzero(self.counts)
+        return int(active[-1] - active[0]) if len(active) else 0
+
+    def most_common(self, n: int = None) -> list:
+        """Returns `(day string, count)` of the `n` most active days, the earlier day first on ties."""
+        active = np.flatnonzero(self.counts)
+        order = active[np.argsort(-self.counts[active], kind='stable')][:n]
+
+        return [(day_to_str(self.start + index), count) for index, count in zip(order.tolist(), self.counts[order].tolist())]
+
+
+def new_hour_of_week() -> np.ndarray:
+    return np.zeros((7, 24), dtype=np.int32)
+
+
+def hour_of_week_counts(hours, counts) -> np.ndarray:
+    """Returns the 7x24 matrix of the messages sent on every weekday and hour (UTC), `counts[i]` messages on the hour ordinal `hours[i]`."""
+    matrix = new_hour_of_week()
+    hours = np.asarray(hours, dtype=np.int64)
+
+    np.add.at(matrix.reshape(-1), (hours + EPOCH_WEEKDAY * 24) % (7 * 24), np.asarray(counts, dtype=np.int32))
+
+    return matrix
+
+
+def hour_of_week_to_dict(matrix: np.ndarray) -> dict:
+    """`{weekday: [messages per hour]}` for the JSON outputs."""
+    return dict(zip(WEEKDAYS, matrix.tolist()))
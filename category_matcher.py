@@ -0,0 +1,121 @@
+"""
+Counts the keywords and phrases of `res/phrases.category_sets` in a single pass over a text.
+
+Every alias (including the `PLURALIZE_CATEGORIES` variants) is expanded once into a trie of word tokens. A text is split into
+word tokens and the separators between them, and the trie is walked from every token, which finds all categories and primary keys at once.
+
+The counts are exactly those of running `re.findall(r'\b(?:primary|alias|...)\b', text)` for every element of every category:
+matches of the same element never overlap and the first matching alias in the element wins. Aliases that do not start and end with
+a word character can not be matched on token boundaries, the elements that contain one fall back to that regex.
+"""
+
+import re
+
+
+TOKEN_SPLIT_PATTERN = re.compile(r'(\W+)')
+TOKEN_PHRASE_PATTERN = re.compile(r'\w(?:.*\w)?', re.DOTALL)
+
+
+def expand_aliases(element, pluralize=False):
+    """Returns the primary key of a `category_sets` element and all of its aliases, in the order they are matched."""
+    if isinstance(element, tuple):
+        primary_key = element[0]
+        aliases = element[1:]
+
+    else:
+        primary_key = element
+        aliases = ()
+
+    if pluralize:
+        aliases += tuple(alias + 's' if not alias.endswith('s') else alias[:-1]+'ies' for alias in aliases)
+        aliases += (primary_key + 's' if not primary_key.endswith('s') else primary_key[:-1]+'ies',)
+
+        if primary_key.endswith('y'):
+            aliases += (primary_key[:-1] + 'ies',)
+
+        elif not primary_key.endswith('s'):
+            aliases += (primary_key + 's',)
+
+    return primary_key, (primary_key,) + aliases
+
+
+class CategoryMatcher:
+    def __init__(self, category_sets: dict, pluralize=False):
+        self.keys = []  # (category, primary_key) of every element, in the order of `category_sets`.
+        self.trie = {}  # token -> [children, ends]; children are keyed by (separator, token), ends hold (element, alias order, token count).
+        self.patterns = []  # (element, compiled regex) of the elements that can not be matched on token boundaries.
+
+        for category, elements in category_sets.items():
+            for element in elements:
+                primary_key, aliases = expand_aliases(element, pluralize)
+                index = len(self.keys)
+                self.keys.append((category, primary_key))
+
+                if all(TOKEN_PHRASE_PATTERN.fullmatch(alias) for alias in aliases):
+                    for order, alias in enumerate(aliases):
+                        self._insert(alias, (index, order))
+
+                else:
+                    pattern = r'\b(?:{})\b'.format('|'.join([re.escape(alias) for alias in aliases]))
+                    self.patterns.append((index, re.compile(pattern)))
+
+    def _insert(self, alias, match):
+        parts = TOKEN_SPLIT_PATTERN.split(alias)
+        node = self.trie.setdefault(parts[0], [{}, []])
+
+        for i in range(1, len(parts), 2):
+            node = node[0].setdefault((parts[i], parts[i + 1]), [{}, []])
+
+        node[1].append((*match, len(parts) // 2 + 1))
+
+    def count(self, text: str) -> dict:
+        """Returns `{element: count}` for every element found in `text`, where `element` indexes `self.keys`."""
+        counts = {}
+        next_free = {}  # Matches of the same element can not overlap, the first token an element may match again.
+
+        parts = TOKEN_SPLIT_PATTERN.split(text)
+        tokens = parts[0::2]
+        separators = parts[1::2]
+        trie = self.trie
+
+        for i, token in enumerate(tokens):
+            node = trie.get(token)
+            if node is None:
+                continue
+
+            best = {}  # element -> (alias order, token count) of the first alias that matches at this token.
+            j = i
+
+            while True:
+                for element, order, length in node[1]:
+                    if element not in best or order < best[element][0]:
+                        best[element] = (order, length)
+
+                if not node[0] or j + 1 >= len(tokens):
+                    break
+
+                node = node[0].get((separators[j], tokens[j + 1]))
+                if node is None:
+                    break
+
+                j += 1
+
+            for element, (_, length) in best.items():
+                if i >= next_free.get(element, 0):
+                    counts[element] = counts.get(element, 0) + 1
+                    next_free[element] = i + length
+
+        for element, pattern in self.patterns:
+            count = len(pattern.findall(text))
+            if count:
+                counts[element] = count
+
+        return counts
+
+    def matches(self, text: str):
+        """Yields `(category, primary_key, count)` for every element found in `text`, in the order of `category_sets`."""
+        counts = self.count(text)
+
+        for element in sorted(counts):
+            category, primary_key = self.keys[element]
+            yield category, primary_key, counts[element]
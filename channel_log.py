@@ -0,0 +1,112 @@
+"""
+Writes the chat log (`GET_CHANNEL_LOG`) through a single buffered file handle per run, optionally compressed.
+
+With `incremental`, the log is kept between runs: a small state file next to it remembers the last logged message, and the next run
+only appends the newer messages instead of rewriting the whole file. The state also records the size of the log, so the lines of an
+interrupted run that were written after the last saved state are cut off before appending.
+"""
+
+import os
+import json
+import gzip
+
+
+EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+BUFFER_SIZE = 2**20
+
+
+def open_log(path: str, mode: str, compression: str = None):
+    if compression == 'gzip':
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.open(path, f'{mode}t', encoding='utf-8')
+
+    return open(path, mode, encoding='utf-8', buffering=BUFFER_SIZE)
+
+
+class ChannelLog:
+    """
+    Lines are written with `write(message_id, line)`, the messages up to `logged_until` are skipped.
+    `settings` describes the format of the lines, an incremental log written with other settings is rewritten from scratch.
+    """
+
+    def __init__(self, path: str, compression: str = None, incremental=False, settings='', logged_until=0):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown channel log compression: {compression!r}, use None, 'gzip' or 'zstd'.")
+
+        self.path = path + EXTENSIONS[compression]
+        self.state_path = f'{self.path}.state'
+        self.compression = compression
+        self.incremental = incremental
+        self.settings = settings
+        self.logged_until = logged_until
+
+        state = self.load_state() if incremental else None
+
+        if state:
+            # Cut off what an interrupted run wrote after its state was saved.
+            if os.path.getsize(self.path) > state['size']:
+                os.truncate(self.path, state['size'])
+
+            self.logged_until = max(logged_until, state['last_message_id'])
+            mode = 'a'
+
+        else:
+            mode = 'w'
+
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+
+        self.last_message_id = self.logged_until  # The newest message in the log.
+        self.file = open_log(self.path, mode, compression)
+
+    def load_state(self):
+        if not os.path.exists(self.path) or not os.path.exists(self.state_path):
+            return None
+
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+
+        except (OSError, ValueError):
+            return None
+
+        if state.get('settings') != self.settings or os.path.getsize(self.path) < state.get('size', 0):
+            return None
+
+        return state
+
+    def write(self, message_id: int, line: str):
+        if message_id <= self.logged_until:
+            return
+
+        self.file.write(line)
+
+        if message_id > self.last_message_id:
+            self.last_message_id = message_id
+
+    def append_part(self, path: str, last_message_id: int):
+        """Appends an uncompressed log written by another process, up to `last_message_id`."""
+        with open(path, 'r', encoding='utf-8') as part:
+            while chunk := part.read(BUFFER_SIZE):
+                self.file.write(chunk)
+
+        self.last_message_id = max(self.last_message_id, last_message_id)
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.file.close()
+
+        if self.incremental:
+            with open(self.state_path, 'w', encoding='utf-8') as file:
+                json.dump({'last_message_id': self.last_message_id, 'size': os.path.getsize(self.path), 'settings': self.settings}, file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -2,14 +2,23 @@ import os
 import json
 import logging
 import asyncio
-import re
+import pickle
+import hashlib
 import sqlite3
 import time
-from datetime import datetime
-from collections import Counter, defaultdict
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, defaultdict, deque
 from res.config import *
 from res.phrases import category_sets, ignored_words
-from fetch_group import get_messages
+from category_matcher import CategoryMatcher
+from tokenizer import Tokenizer
+from text_normalizer import TextNormalizer
+from channel_log import ChannelLog
+from activity import DailySeries, hour_of_week_counts, hour_of_week_to_dict, new_hour_of_week
+from heavy_hitters import SpaceSaving
+from vocabulary import Vocabulary, WordCounts
+from fetch_group import MAX_MESSAGE_ID, configure_connection, count_messages, get_activity_counts, get_committed_message_id, get_messages, get_reaction_counts, get_users, split_message_ranges
 
 
 if CONVERT_UNICODE:
@@ -20,7 +29,15 @@ if CONVERT_UNICODE:
         exit(1)
 
 
-if ANALYZE_SENTIMENTS:
+if GET_CHANNEL_LOG and CHANNEL_LOG_COMPRESSION == 'zstd':
+    try:
+        import zstandard
+    except ImportError:
+        print("Please install the zstandard module to use CHANNEL_LOG_COMPRESSION = 'zstd'.\nRun: pip install zstandard")
+        exit(1)
+
+
+if ANALYZE_SENTIMENTS and SENTIMENT_BACKEND == 'transformers':
     """
     This is an exmple sentinment analysis pipeline using the transformers library. It may not be accurate depending on the dataset.
     """
@@ -28,11 +45,21 @@ if ANALYZE_SENTIMENTS:
         logging.info('Loading the sentiment analysis pipeline...')
         from transformers import pipeline
         emotion_pipeline = pipeline(*SENTIMENT_PIPELINE_ARGS, **SENTIMENT_PIPELINE_KWARGS)
+        sentiment_model = str(SENTIMENT_PIPELINE_KWARGS.get('model') or SENTIMENT_PIPELINE_ARGS)
         logging.info('Sentiment analysis pipeline loaded.')
     except ImportError:
         print('Please install the transformers module to use the ANALYZE_SENTIMENTS option.\nAdditionally, one of torch or tensorflow is required.\nRun: pip install transformers')
         exit(1)
 
+elif ANALYZE_SENTIMENTS and SENTIMENT_BACKEND == 'lexicon':
+    from lexicon_sentiment import LexiconSentiment
+    emotion_lexicon = LexiconSentiment()
+    sentiment_model = f'lexicon-{LexiconSentiment.VERSION}'
+
+elif ANALYZE_SENTIMENTS:
+    print(f"Unknown SENTIMENT_BACKEND: {SENTIMENT_BACKEND!r}, use 'transformers' or 'lexicon'.")
+    exit(1)
+
 
 logging.basicConfig(level=logging.INFO)
 
@@ -41,9 +68,15 @@ if not os.path.exists(output_folder):
     os.makedirs(output_folder)
 
 
-if GET_CHANNEL_LOG:
-    with open(log_channel_file, 'w', encoding='utf-8') as file:
-        file.write('')
+STATE_VERSION = 4
+
+category_matcher = CategoryMatcher(category_sets, PLURALIZE_CATEGORIES)
+text_normalizer = TextNormalizer(CONVERT_UNICODE, IGNORE_URLS, ACCENTED_CHARS if REMOVE_ACCENTS else None)
+tokenizer = Tokenizer(MIN_WORD_LENGTH, CASE_INSENSITIVE, ignored_words if IGNORE_COMMON_WORDS else ())
+
+
+def new_word_counter(capacity: int = None):
+    return SpaceSaving(capacity) if capacity else WordCounts()
 
 
 class User:
@@ -69,12 +102,12 @@ class User:
         self.naughtiness = 0
         self.messages_by_feeling = Counter()
         self.feeling_ratios = Counter()
-        self.word_counter = Counter()  # All words used by the user.
-        self.daily_message_counter = Counter()  # Number of messages sent per day.
+        self.word_counter = new_word_counter(USER_WORD_COUNTER_CAPACITY)  # Ids of all words used by the user, see global_stats['vocabulary'].
+        self.daily_message_counter = DailySeries()  # Number of messages sent per day.
+        self.hourly_activity = new_hour_of_week()  # Number of messages sent per weekday and hour.
         self.category_words = defaultdict(Counter)  # Keywords and phrases.
         self.reactions_given = Counter()
         self.reactions_received = Counter()
-        self.total_string = ''  # All messages concatenated.
     
     def is_outlier(self):
         below_min = self.message_count < OUTLIER_MIN_MESSAGES or len(self.daily_message_counter) < OUTLIER_MIN_ACTIVE_DAYS
@@ -82,15 +115,30 @@ class User:
 
         return below_min or above_max
 
+    def merge(self, other: 'User'):
+        """Adds the counts of `other`, the same user collected from a later shard of the messages."""
+        self.name = self.name or other.name
+
+        for attr in ('message_count', 'word_count', 'letter_count', 'media_count', 'loud_word_count', 'loud_message_count', 'curse_count'):
+            setattr(self, attr, getattr(self, attr) + getattr(other, attr))
+
+        for attr in ('messages_by_feeling', 'feeling_ratios', 'word_counter', 'daily_message_counter', 'reactions_given', 'reactions_received'):
+            getattr(self, attr).update(getattr(other, attr))
+
+        self.hourly_activity += other.hourly_activity
+
+        for category, counter in other.category_words.items():
+            self.category_words[category].update(counter)
+
 
 def calculate_user_ratios(user: User, global_stats: dict):
     user.reactions_given_count = sum(user.reactions_given.values())
     user.reactions_received_count = sum(user.reactions_received.values())
-    user.messages_per_active_day = user.message_count / len(user.daily_message_counter) if len(user.daily_message_counter) else 0 
+    active_days = len(user.daily_message_counter)
+    user.messages_per_active_day = user.message_count / active_days if active_days else 0 
     
-    default_date = Counter({DEFAULT_DATE: 1})
-    delta = datetime.strptime(max(user.daily_message_counter.keys() or default_date), '%Y-%m-%d') - datetime.strptime(min(user.daily_message_counter.keys() or default_date), '%Y-%m-%d')
-    user.messages_per_day = user.message_count / delta.days if delta.days else 0
+    days = user.daily_message_counter.span()
+    user.messages_per_day = user.message_count / days if days else 0
 
     mc = user.message_count
     user.words_per_message = user.word_count / mc if mc else 0
@@ -124,10 +172,11 @@ def calculate_user_ratios(user: User, global_stats: dict):
 
 def calculate_global_ratios(global_stats: dict):
     gmc = global_stats['message_count']
-    delta = datetime.strptime(max(global_stats['daily_message_counter'].keys()), '%Y-%m-%d') - datetime.strptime(min(global_stats['daily_message_counter'].keys()), '%Y-%m-%d')
+    active_days = len(global_stats['daily_message_counter'])
+    days = global_stats['daily_message_counter'].span()
 
-    global_stats['ratios']['messages_per_active_day'] = gmc / len(global_stats['daily_message_counter']) if len(global_stats['daily_message_counter']) else 0
-    global_stats['ratios']['messages_per_day'] = gmc / delta.days if delta.days else 0
+    global_stats['ratios']['messages_per_active_day'] = gmc / active_days if active_days else 0
+    global_stats['ratios']['messages_per_day'] = gmc / days if days else 0
     global_stats['ratios']['words_per_message'] = global_stats['word_count'] / gmc
     global_stats['ratios']['media_per_message'] = global_stats['media_count'] / gmc
     global_stats['ratios']['reaction_ratio'] = global_stats['reaction_count'] / gmc
@@ -135,199 +184,295 @@ def calculate_global_ratios(global_stats: dict):
     global_stats['ratios']['naughtiness'] = global_stats['curse_count'] / gmc
 
 
-def analyze_message(user: User, global_stats: dict):
-    text = user.total_string
+def analyze_message(user: User, global_stats: dict, text: str):
+    for category, primary_key, count in category_matcher.matches(text):
+        global_stats['top_categories'][category][primary_key] += count
+        user.category_words[category][primary_key] += count
 
-    for category, elements in category_sets.items():
-        for element in elements:
-            if isinstance(element, tuple):
-                primary_key = element[0]
-                aliases = element[1:]
+        if category == 'curses':
+            user.curse_count += count
+            global_stats['curse_count'] += count
 
-            else:
-                primary_key = element
-                aliases = ()
 
-            if PLURALIZE_CATEGORIES:
-                aliases += tuple(alias + 's' if not alias.endswith('s') else alias[:-1]+'ies' for alias in aliases)
-                aliases += (primary_key + 's' if not primary_key.endswith('s') else primary_key[:-1]+'ies',)
+def analyze_sentiments(texts: list) -> list:
+    """Returns `{label: score}` for every text, scored by the configured `SENTIMENT_BACKEND`."""
+    if SENTIMENT_BACKEND == 'lexicon':
+        return emotion_lexicon(texts)
 
-                if primary_key.endswith('y'):
-                    aliases += (primary_key[:-1] + 'ies',)
+    return analyze_pipeline_sentiments(texts)
 
-                elif not primary_key.endswith('s'):
-                    aliases += (primary_key + 's',)
-            
-            pattern = r'\b(?:{})\b'.format('|'.join([re.escape(alias) for alias in (primary_key,) + aliases]))
-            count = len(re.findall(pattern, text))
-            
-            if count > 0:
-                if isinstance(element, tuple):
-                    primary_key = element[0]
 
-                else:
-                    primary_key = element
-                    
-                global_stats['top_categories'][category][primary_key] += count
-                user.category_words[category][primary_key] += count
+def analyze_pipeline_sentiments(texts: list) -> list:
+    """Scores `texts` with a single pipeline call. Texts longer than the chunk size are split and the scores of their chunks are averaged."""
+    chunk_size = 512
+    chunks = []
+    spans = []
 
-                if category == 'curses':
-                    user.curse_count += count
-                    global_stats['curse_count'] += count
+    for text in texts:
+        start = len(chunks)
 
+        if len(text) <= chunk_size:
+            chunks.append(text)
 
-def analyze_sentiments(text: str):
-    chunk_size = 512
+        else:
+            chunks.extend(text[i:i+chunk_size] for i in range(0, len(text), chunk_size))
 
-    if len(text) <= chunk_size:
-        results = emotion_pipeline(text)[0]
-        result = {}
-        
-        for sentiment in results:
-            result.update({sentiment['label']: sentiment['score']})
+        spans.append((start, len(chunks)))
 
-    else:
-        chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-        chunk_count = len(chunks)
-        result = {}
+    results = emotion_pipeline(chunks, batch_size=SENTIMENT_BATCH_SIZE)
+    sentiments = []
 
-        for chunk in chunks:
-            results = emotion_pipeline(chunk)[0]
+    for start, end in spans:
+        chunk_count = end - start
+        result = {}
 
-            for sentiment in results:
+        for chunk_result in results[start:end]:
+            for sentiment in ([chunk_result] if isinstance(chunk_result, dict) else chunk_result):
                 label = sentiment['label']
                 score = sentiment['score']
 
-                result[label] = result.get(label, 0) + score / chunk_count
+                result[label] = score if chunk_count == 1 else result.get(label, 0) + score / chunk_count
 
-    return result
+        sentiments.append(result)
 
+    return sentiments
 
-def fetch_message_stats(message, user_stats: dict, global_stats: dict):
-    sender_id = message.sender_id
-    user = user_stats[sender_id]
-    user.message_count += 1
 
-    if not user.name:
-        if message.sender:
-            if message.sender.first_name:
-                user.name = message.sender.first_name + (' ' + message.sender.last_name if message.sender.last_name else '')
-            elif message.sender.username:
-                user.name = message.sender.username
-            else:
-                user.name = 'Unknown User'
-        else:
-            user.name = 'Unknown User'
+def score_texts(texts: list) -> list:
+    try:
+        return analyze_sentiments(texts)
 
-    date_str = message.date.strftime('%Y-%m-%d')
-    user.daily_message_counter[date_str] += 1
+    except Exception as e:
+        if len(texts) == 1:
+            logging.error(f'Error in sentiment analysis: {e}')
+            return [{}]
 
-    if message.media:
-        user.media_count += 1
-        global_stats['media_count'] += 1
+        # Retry one by one so a single bad text does not discard the whole batch.
+        return [score_texts([text])[0] for text in texts]
 
-    if COUNT_REACTIONS and message.reactions:
-        for reaction in message.reactions:
-            if reaction.peer_id:
-                reaction_user = user_stats.get(reaction.peer_id.user_id, None)
 
-                if not reaction_user:
-                    reaction_user = User(reaction.peer_id.user_id)
-                    user_stats[reaction.peer_id.user_id] = reaction_user
+def apply_sentiments(user: User, global_stats: dict, sentiments: dict):
+    user.feeling_ratios.update(sentiments)
+    global_stats['feeling_ratios'].update(sentiments)
 
-                reaction_user.reactions_given[reaction.reaction] += 1
+    filtered_sentiments = {k: v for k, v in sentiments.items() if dominant_sentiment_filter(k, v)}
+    dominant_sentiment = max(filtered_sentiments, key=filtered_sentiments.get) if filtered_sentiments else None
+    if dominant_sentiment:
+        user.messages_by_feeling[dominant_sentiment] += 1
+        global_stats['messages_by_feeling'][dominant_sentiment] += 1
 
-            user.reactions_received[reaction.reaction] += 1
-            global_stats['top_reactions'][reaction.reaction] += 1
-            global_stats['reaction_count'] += 1
 
-    if not message.text:
-        return
-    
-    if CONVERT_UNICODE:
-        text = unidecode(message.text)
+class SentimentQueue:
+    """
+    Collects the texts to analyze and scores them `SENTIMENT_BATCH_SIZE` at a time.
+    Pipeline scores are cached in `sentiment_cache_db` by text hash and model, a text is never analyzed twice by the same model.
+    The lexicon backend is faster than a cache lookup and is not cached.
 
-    else:
-        text = message.text.encode('utf-8', errors='replace').decode('utf-8')
+    With `workers`, batches are scored by background processes while the messages keep being counted. Results are folded into the
+    stats in the order the batches were queued, so the totals are the same as when scoring in the main process.
+    """
+
+    def __init__(self, global_stats: dict, workers: int = 0):
+        self.global_stats = global_stats
+        self.pending = []  # (user, text) in message order.
+        self.running = deque()  # (pending, hashes, scores, missing, future) of the batches waiting for their scores, oldest first.
+        self.model = sentiment_model
+        self.cached_count = 0
+
+        self.executor = ProcessPoolExecutor(workers) if workers else None
+        self.max_running = workers * 2  # Enough to keep every worker busy, counting pauses beyond that.
+
+        self.conn = None
+
+        if SENTIMENT_BACKEND != 'lexicon':
+            self.conn = sqlite3.connect(sentiment_cache_db, timeout=60)
+            configure_connection(self.conn)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS sentiments (text_hash TEXT, model TEXT, scores TEXT, PRIMARY KEY (text_hash, model))')
+            self.conn.commit()
+
+    def put(self, user: User, text: str):
+        self.pending.append((user, text))
+
+        if len(self.pending) >= SENTIMENT_BATCH_SIZE:
+            self.flush()
 
-    if GET_CHANNEL_LOG:
-        if SHOW_DATE:
-            date_str = message.date.strftime('%Y-%m-%d %H:%M:%S')
-            _text = f'[ {date_str} ] <{user.name}> {text}\n'
+    def flush(self):
+        if not self.pending:
+            return
+
+        if self.conn:
+            hashes = [hashlib.sha256(text.encode('utf-8', errors='replace')).hexdigest() for _, text in self.pending]
+            unique_hashes = list(dict.fromkeys(hashes))
+
+            placeholders = ', '.join('?' * len(unique_hashes))
+            rows = self.conn.execute(f'SELECT text_hash, scores FROM sentiments WHERE model = ? AND text_hash IN ({placeholders})', (self.model, *unique_hashes))
+            scores = {text_hash: json.loads(sentiments) for text_hash, sentiments in rows}
+            self.cached_count += sum(text_hash in scores for text_hash in hashes)
 
         else:
-            _text = f'<{user.name}> {text}\n'
+            hashes = [text for _, text in self.pending]  # Without a cache the texts themselves are the keys.
+            scores = {}
+
+        missing = {text_hash: text for text_hash, (_, text) in zip(hashes, self.pending) if text_hash not in scores}
+        if not missing:
+            future = None
 
-        with open(log_channel_file, 'a', encoding='utf-8') as file:
-            file.write(_text)
+        elif self.executor:
+            future = self.executor.submit(score_texts, list(missing.values()))
 
-    if IGNORE_URLS:
-        text = re.sub(r'http\S+', ' ', text)
+        else:
+            self.store(scores, missing, score_texts(list(missing.values())))
+            future = None
 
-    if REMOVE_ACCENTS:
-        for letter, accents in ACCENTED_CHARS.items():
-            text = re.sub(f'[{accents}]', letter, text)
+        self.running.append((self.pending, hashes, scores, missing, future))
+        self.pending = []
+        self.collect()
 
-    # Pattern for matching mentions, [name](tg://user?id=id)
-    pattern = r'\[(.*?)\]\(tg://user\?id=(\d+)\)'
-    match = re.search(pattern, text)
+    def collect(self, wait=False):
+        """Applies the finished batches in queue order. Waits for the oldest batch while too many are running, or for all of them with `wait`."""
+        while self.running:
+            pending, hashes, scores, missing, future = self.running[0]
 
-    if match:
-        name = match.group(1)
-        text = re.sub(pattern, name, text)
+            if future:
+                if not (wait or future.done() or len(self.running) > self.max_running):
+                    break
 
-    if ANALYZE_SENTIMENTS:
-        try:
-            sentiments = analyze_sentiments(text)
+                try:
+                    results = future.result()
 
-        except Exception as e:
-            logging.error(f'Error in sentiment analysis: {e}')
-            sentiments = {}
+                except Exception as e:
+                    logging.error(f'Sentiment worker failed, scoring the batch in the main process: {e}')
+                    results = score_texts(list(missing.values()))
+
+                self.store(scores, missing, results)
+
+            for (user, _), text_hash in zip(pending, hashes):
+                apply_sentiments(user, self.global_stats, scores[text_hash])
+
+            self.running.popleft()
+
+    def store(self, scores: dict, missing: dict, results: list):
+        results = dict(zip(missing, results))
+        scores.update(results)
+
+        if not self.conn:
+            return
+
+        # Failed texts are not cached, they are analyzed again on the next run.
+        self.conn.executemany('INSERT OR IGNORE INTO sentiments VALUES (?, ?, ?)', [(text_hash, self.model, json.dumps(sentiments)) for text_hash, sentiments in results.items() if sentiments])
+        self.conn.commit()
 
-        user.feeling_ratios.update(sentiments)
-        global_stats['feeling_ratios'].update(sentiments)
-        
-        filtered_sentiments = {k: v for k, v in sentiments.items() if dominant_sentiment_filter(k, v)}
-        dominant_sentiment = max(filtered_sentiments, key=filtered_sentiments.get) if filtered_sentiments else None
-        if dominant_sentiment:
-            user.messages_by_feeling[dominant_sentiment] += 1
-            global_stats['messages_by_feeling'][dominant_sentiment] += 1
+    def close(self):
+        self.flush()
+        self.collect(wait=True)
+
+        if self.conn:
+            self.conn.close()
+
+        if self.executor:
+            self.executor.shutdown()
+
+
+def count_activity(user_stats: dict, global_stats: dict, min_id: int, max_id: int):
+    # Activity is aggregated by the database, one row per (sender, hour).
+    users = get_users()
+    activity = {}  # sender_id -> ([hour], [message count]), added to the daily series and the hourly activity at once.
+
+    for sender_id, hour, message_count, media_count in get_activity_counts(min_id, max_id):
+        user = user_stats.get(sender_id, None)
+
+        if not user:
+            user = User(sender_id)
+            user_stats[sender_id] = user
+
+        if not user.name:
+            sender = users.get(sender_id, None)
+            user.name = sender.name if sender else 'Unknown User'
+
+        user.message_count += message_count
+        user.media_count += media_count
+        global_stats['media_count'] += media_count
+
+        hours, counts = activity.setdefault(sender_id, ([], []))
+        hours.append(hour)
+        counts.append(message_count)
+
+    for sender_id, (hours, counts) in activity.items():
+        user = user_stats[sender_id]
+        user.daily_message_counter.add([hour // 24 for hour in hours], counts)
+        user.hourly_activity += hour_of_week_counts(hours, counts)
+
+
+def count_reactions(user_stats: dict, global_stats: dict, min_id: int, max_id: int):
+    # Reactions are aggregated by the database, one row per (sender, reacting user, reaction).
+    for sender_id, reactor_id, reaction, count in get_reaction_counts(min_id, max_id):
+        if reactor_id is not None:
+            reaction_user = user_stats.get(reactor_id, None)
+
+            if not reaction_user:
+                reaction_user = User(reactor_id)
+                user_stats[reactor_id] = reaction_user
+
+            reaction_user.reactions_given[reaction] += count
+
+        user_stats[sender_id].reactions_received[reaction] += count
+        global_stats['top_reactions'][reaction] += count
+        global_stats['reaction_count'] += count
+
+
+def channel_log_line(message, user: User, text: str) -> str:
+    if SHOW_DATE:
+        date_str = message.date.strftime('%Y-%m-%d %H:%M:%S')
+        return f'[ {date_str} ] <{user.name}> {text}\n'
+
+    return f'<{user.name}> {text}\n'
+
+
+def fetch_message_stats(message, user_stats: dict, global_stats: dict, channel_log: ChannelLog = None, sentiments: SentimentQueue = None):
+    # Message, media and daily counts are aggregated by the database in count_activity, only the text is analyzed here.
+    user = user_stats[message.sender_id]
+
+    if not message.text:
+        return
+    
+    text = text_normalizer.transliterate(message.text)
+
+    if channel_log:
+        channel_log.write(message.id, channel_log_line(message, user, text))
+
+    text = text_normalizer.clean(text)
+
+    if ANALYZE_SENTIMENTS:
+        sentiments.put(user, text)
 
     if text.isupper():
         user.loud_message_count += 1
         global_stats['loud_message_count'] += 1
 
-    words = [word for word in re.findall(r'\b\w+\b', text) if len(word) >= MIN_WORD_LENGTH]
-    word_count = len(words)
-    letter_count = sum(len(word) for word in words)
+    words, word_count, letter_count, loud_word_count = tokenizer.tokenize(text)
 
-    loud_words = [word for word in words if word.isupper()]
-    user.loud_word_count += len(loud_words)
-    global_stats['loud_word_count'] += len(loud_words)
+    user.loud_word_count += loud_word_count
+    global_stats['loud_word_count'] += loud_word_count
 
     if CASE_INSENSITIVE:
         text = text.lower()
-        words = [word.lower() for word in words]
 
-    if IGNORE_COMMON_WORDS:
-        words = [word for word in words if word not in ignored_words]
+    word_ids = global_stats['vocabulary'].encode(words)
 
-    user.word_counter.update(words)
+    user.word_counter.update(word_ids)
     user.word_count += word_count
     user.letter_count += letter_count
 
-    global_stats['top_words'].update(words)
+    global_stats['top_words'].update(word_ids)
     global_stats['word_count'] += word_count
     global_stats['letter_count'] += letter_count
 
-    # Update the total string for category matching along with a separator. 
-    # Part of the string analysis is done cumulatively in the analyze_message function.
-    user.total_string += text + '\n\n\n'
+    # Categories are counted as the messages stream through, no text is kept once a message is processed.
+    analyze_message(user, global_stats, text)
 
 
-async def collect_stats():
-    user_stats = {}
-    global_stats = {
+def new_global_stats():
+    return {
         'id': telegram_group_id,
         'name': telegram_group_name,
         'message_count': 0,
@@ -349,7 +494,8 @@ async def collect_stats():
         },
         'messages_by_feeling': Counter(),
         'feeling_ratios': Counter(),
-        'daily_message_counter': Counter(),
+        'daily_message_counter': DailySeries(),
+        'hourly_activity': new_hour_of_week(),
         'active_users': dict(),
         'media_users': dict(),
         'loud_users': dict(),
@@ -358,38 +504,238 @@ async def collect_stats():
         'cursing_users': dict(),
         'top_reactions': Counter(),
         'top_categories': defaultdict(Counter),
-        'top_words': Counter(),
+        'top_words': new_word_counter(GLOBAL_WORD_COUNTER_CAPACITY),
+        'vocabulary': Vocabulary(),  # The words of the word counters.
     }
 
+
+def merge_global_stats(global_stats: dict, other: dict):
+    """Adds the counts of `other`, collected from a later shard of the messages."""
+    for key in ('word_count', 'letter_count', 'media_count', 'loud_word_count', 'loud_message_count', 'curse_count'):
+        global_stats[key] += other[key]
+
+    for key in ('messages_by_feeling', 'feeling_ratios', 'top_words'):
+        global_stats[key].update(other[key])
+
+    for category, counter in other['top_categories'].items():
+        global_stats['top_categories'][category].update(counter)
+
+
+def merge_user_stats(user_stats: dict, other: dict):
+    for user_id, user in other.items():
+        if user_id in user_stats:
+            user_stats[user_id].merge(user)
+
+        else:
+            user_stats[user_id] = user
+
+
+def collect_shard(min_id: int, max_id: int, log_file: str, logged_until: int):
+    """
+    Runs in a worker process. Returns the partial `(user_stats, global_stats, message count, last logged message)` of the messages with `min_id < id <= max_id`.
+    The channel log of the shard is written to `log_file`.
+    """
+    user_stats = {}
+    global_stats = new_global_stats()
+    # Shards already run in parallel, their sentiments are scored in the shard's own process.
+    sentiments = SentimentQueue(global_stats) if ANALYZE_SENTIMENTS else None
+    channel_log = ChannelLog(log_file, logged_until=logged_until) if log_file else None
     processed_messages = 0
-    total_messages = sum(1 for _ in get_messages())
 
-    for message in get_messages():
+    for message in get_messages(with_reactions=False, min_id=min_id, max_id=max_id, text_only=True):
         if message.sender_id:
             if message.sender_id not in user_stats:
-                user_stats[message.sender_id] = User(message.sender_id)
+                user = User(message.sender_id)
+                user.name = message.sender.name if message.sender else 'Unknown User'  # Used by the channel log.
+                user_stats[message.sender_id] = user
 
-            fetch_message_stats(message, user_stats, global_stats)
+            fetch_message_stats(message, user_stats, global_stats, channel_log, sentiments)
+
+        processed_messages += 1
+
+    if sentiments:
+        sentiments.close()
+
+    if channel_log:
+        channel_log.close()
+
+    return user_stats, global_stats, processed_messages, channel_log.last_message_id if channel_log else 0
+
+
+def collect_shards(user_stats: dict, global_stats: dict, min_id: int, max_id: int, total_messages: int, channel_log: ChannelLog = None):
+    # More shards than workers keeps every process busy when some id ranges hold longer messages than others.
+    shards = split_message_ranges(COLLECT_WORKERS * 4, min_id, max_id)
+    log_files = [f'{log_channel_file}.part{i}' if channel_log else None for i in range(len(shards))]
+    logged_until = channel_log.logged_until if channel_log else 0
+    processed_messages = 0
+
+    with ProcessPoolExecutor(COLLECT_WORKERS) as executor:
+        # Results are returned in shard order, so users, words and categories are merged in the order a single process would have seen them.
+        results = executor.map(collect_shard, *zip(*shards), log_files, [logged_until] * len(shards))
+
+        for log_file, (shard_users, shard_stats, shard_messages, last_logged_id) in zip(log_files, results):
+            # Every shard numbers its words from 0, they are moved to the ids of the merged vocabulary first.
+            mapping = global_stats['vocabulary'].merge(shard_stats['vocabulary'])
+            for counter in [user.word_counter for user in shard_users.values()] + [shard_stats['top_words']]:
+                counter.remap(mapping)
+
+            merge_user_stats(user_stats, shard_users)
+            merge_global_stats(global_stats, shard_stats)
+
+            if log_file:
+                channel_log.append_part(log_file, last_logged_id)
+                os.remove(log_file)
+
+            processed_messages += shard_messages
+            if SHOW_PROGRESS_BAR:
+                print(f'\rProcessed Messages: [{processed_messages} / {total_messages}]', end='')
+
+
+def reset_derived_stats(global_stats: dict):
+    """Clears the global stats that are recomputed from the per-user stats at the end of every run."""
+    global_stats['message_count'] = 0
+    global_stats['daily_message_counter'] = DailySeries()
+    global_stats['hourly_activity'] = new_hour_of_week()
+
+    for ranking in ('active_users', 'media_users', 'loud_users', 'reacting_users', 'reacted_users', 'cursing_users'):
+        global_stats[ranking] = dict()
+
+
+def settings_fingerprint():
+    """A hash of every setting that changes how messages are counted. A saved state is discarded when it no longer matches."""
+    settings = (
+        CASE_INSENSITIVE, CONVERT_UNICODE, REMOVE_ACCENTS, ACCENTED_CHARS, PLURALIZE_CATEGORIES, IGNORE_COMMON_WORDS, IGNORE_URLS,
+        COUNT_REACTIONS, NUMERIC_ONLY, MIN_WORD_LENGTH, USER_WORD_COUNTER_CAPACITY, GLOBAL_WORD_COUNTER_CAPACITY, ANALYZE_SENTIMENTS, SENTIMENT_BACKEND, SENTIMENT_PIPELINE_ARGS, SENTIMENT_PIPELINE_KWARGS,
+        sorted((category, sorted(map(repr, elements))) for category, elements in category_sets.items()),
+        sorted(ignored_words),
+    )
+
+    return hashlib.sha256(repr(settings).encode()).hexdigest()
+
+
+def load_state():
+    """Returns `(user_stats, global_stats, last_message_id)` saved by the previous incremental run, or None."""
+    if not os.path.exists(collect_state_file):
+        return None
+
+    try:
+        with open(collect_state_file, 'rb') as file:
+            state = pickle.load(file)
+
+    except Exception as e:
+        logging.warning(f'Could not load the saved state, collecting from scratch: {e}')
+        return None
+
+    if state.get('version') != STATE_VERSION or state.get('settings') != settings_fingerprint():
+        logging.info('The configuration changed since the last run, collecting from scratch.')
+        return None
+
+    return state['user_stats'], state['global_stats'], state['last_message_id']
+
+
+def save_state(user_stats: dict, global_stats: dict, last_message_id: int):
+    state = {
+        'version': STATE_VERSION,
+        'settings': settings_fingerprint(),
+        'last_message_id': last_message_id,
+        'user_stats': user_stats,
+        'global_stats': global_stats,
+    }
+
+    # Write to a temporary file first so an interrupted run never leaves a truncated state behind.
+    with open(f'{collect_state_file}.tmp', 'wb') as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(f'{collect_state_file}.tmp', collect_state_file)
+
+
+def open_channel_log(incremental: bool):
+    if not GET_CHANNEL_LOG:
+        return nullcontext()
+
+    # The log is rewritten when the format of its lines changes.
+    settings = repr((SHOW_DATE, CONVERT_UNICODE))
+
+    return ChannelLog(log_channel_file, CHANNEL_LOG_COMPRESSION, incremental, settings)
+
+
+def write_channel_log(user_stats: dict, channel_log: ChannelLog, max_id: int):
+    """Writes the log lines of the messages up to `max_id` that are missing from it, without counting them again."""
+    for message in get_messages(with_reactions=False, min_id=channel_log.logged_until, max_id=max_id, text_only=True):
+        if message.sender_id:
+            channel_log.write(message.id, channel_log_line(message, user_stats[message.sender_id], text_normalizer.transliterate(message.text)))
+
+
+def process_messages(user_stats: dict, global_stats: dict, min_id: int, max_id: int, channel_log: ChannelLog = None):
+    processed_messages = 0
+    total_messages = count_messages(min_id, max_id, text_only=True)
+
+    if COLLECT_WORKERS > 1:
+        collect_shards(user_stats, global_stats, min_id, max_id, total_messages, channel_log)
+        return
+
+    sentiments = SentimentQueue(global_stats, SENTIMENT_WORKERS) if ANALYZE_SENTIMENTS else None
+
+    for message in get_messages(with_reactions=False, min_id=min_id, max_id=max_id, text_only=True):
+        if message.sender_id:
+            fetch_message_stats(message, user_stats, global_stats, channel_log, sentiments)
 
         processed_messages += 1
         if SHOW_PROGRESS_BAR:
             print(f'\rProcessed Messages: [{processed_messages} / {total_messages}]', end='')
 
-    if SHOW_PROGRESS_BAR:
-        print()
+    if sentiments:
+        sentiments.close()
+        logging.info(f'{sentiments.cached_count} sentiment scores were reused from the cache.')
+
+
+async def collect_stats():
+    state = load_state() if INCREMENTAL_COLLECT else None
+
+    if state:
+        user_stats, global_stats, last_message_id = state
+        global_stats.update({'id': telegram_group_id, 'name': telegram_group_name})
+        logging.info(f'Resuming from message {last_message_id}.')
+
+    else:
+        user_stats = {}
+        global_stats = new_global_stats()
+        last_message_id = 0
+
+    # Only the part of the history that is already complete is processed, the rest is picked up by the next run.
+    max_id = get_committed_message_id() if INCREMENTAL_COLLECT else MAX_MESSAGE_ID
+
+    count_activity(user_stats, global_stats, last_message_id, max_id)
+
+    if not NUMERIC_ONLY:
+        # A resumed run appends to the log of the previous one.
+        with open_channel_log(INCREMENTAL_CHANNEL_LOG or INCREMENTAL_COLLECT) as channel_log:
+            # The log could not be resumed (missing, or written with other settings), the lines of the counted messages are written again.
+            if channel_log and channel_log.logged_until < last_message_id:
+                logging.info(f'Rewriting the chat log up to message {last_message_id}.')
+                write_channel_log(user_stats, channel_log, last_message_id)
+
+            process_messages(user_stats, global_stats, last_message_id, max_id, channel_log)
+
+        if SHOW_PROGRESS_BAR:
+            print()
+
+    if COUNT_REACTIONS:
+        count_reactions(user_stats, global_stats, last_message_id, max_id)
 
     total_users = len(user_stats)
     if not total_users:
         print('No data was collected. Exiting...')
         exit(0)
 
-    for i, user in enumerate(user_stats.values(), 1):
-        analyze_message(user, global_stats)
+    reset_derived_stats(global_stats)
 
+    for i, user in enumerate(user_stats.values(), 1):
         if CALCULATE_USER_RATIOS:
             calculate_user_ratios(user, global_stats)
 
         global_stats['daily_message_counter'].update(user.daily_message_counter)
+        global_stats['hourly_activity'] += user.hourly_activity
         global_stats['message_count'] += user.message_count
 
         if SHOW_PROGRESS_BAR:
@@ -406,7 +752,10 @@ async def collect_stats():
         calculate_global_ratios(global_stats)
 
     save_global_stats(global_stats)
-    save_user_stats(user_stats)
+    save_user_stats(user_stats, global_stats['vocabulary'])
+
+    if INCREMENTAL_COLLECT:
+        save_state(user_stats, global_stats, max_id)
 
 
 def save_global_stats(global_stats: dict):
@@ -433,6 +782,7 @@ def save_global_stats(global_stats: dict):
         **({'feeling_ratios': dict(global_stats['feeling_ratios'])} if ANALYZE_SENTIMENTS else {}),
         'top_reactions': dict(global_stats['top_reactions'].most_common(GLOBAL_REACTION_LIMIT)),
         'top_active_days': dict(global_stats['daily_message_counter'].most_common(GLOBAL_ACTIVE_DAYS_LIMIT)),
+        'hourly_activity': hour_of_week_to_dict(global_stats['hourly_activity']),
         'top_active_users': {user_id: {'name': user.name, 'messages_per_active_day': user.messages_per_active_day, 'message_count': user.message_count, 'word_count': user.word_count, 'letter_count': user.letter_count} for user_id, user in limited_top_active_users},
         'top_loud_users': {user_id: {'name': user.name, 'loudness': user.loudness, 'loud_word_count': user.loud_word_count} for user_id, user in limited_top_loud_users},
         'top_media_users': {user_id: {'name': user.name, 'media_per_message': user.media_per_message, 'media_count': user.media_count} for user_id, user in limited_top_media_users},
@@ -440,50 +790,99 @@ def save_global_stats(global_stats: dict):
         'top_reacting_users': {user_id: {'name': user.name, 'rg_ratio': user.rg_ratio, 'reactions_given_count': user.reactions_given_count} for user_id, user in limited_top_reacting_users},
         'top_cursing_users': {user_id: {'name': user.name, 'naughtiness': user.naughtiness, 'curse_count': user.curse_count} for user_id, user in limited_top_cursing_users},
         'top_categories': {k: dict(v.most_common(GLOBAL_CATEGORY_LIMIT)) for k, v in global_stats['top_categories'].items()},
-        'top_words': dict(global_stats['top_words'].most_common(GLOBAL_WORD_LIMIT)),
+        'top_words': global_stats['vocabulary'].to_words(global_stats['top_words'].most_common(GLOBAL_WORD_LIMIT)),
+        **({'top_words_error_bound': global_stats['top_words'].error_bound()} if GLOBAL_WORD_COUNTER_CAPACITY else {}),
     }
 
     with open(global_stats_json, 'w', encoding='utf-8') as file:
-        json.dump(json_global_stats, file, indent=4, ensure_ascii=False)
+        dump_json(json_global_stats, file)
+
+
+def user_json_stats(user: User, vocabulary: Vocabulary) -> dict:
+    """The saved stats of a user, every top-N view is computed once and shared by user_stats.json and users.db."""
+    return {
+        'id': user.user_id,
+        'name': user.name,
+        'message_count': user.message_count,
+        'word_count': user.word_count,
+        'letter_count': user.letter_count,
+        'media_count': user.media_count,
+        'reactions_given_count': user.reactions_given_count,
+        'reactions_received_count': user.reactions_received_count,
+        'loud_word_count': user.loud_word_count,
+        'loud_message_count': user.loud_message_count,
+        'curse_count': user.curse_count,
+        **({'ratios': {
+            'messages_per_active_day': user.messages_per_active_day,
+            'messages_per_day': user.messages_per_day,
+            'words_per_message': user.words_per_message,
+            'media_per_message': user.media_per_message,
+            'rg_ratio': user.rg_ratio,
+            'rr_ratio': user.rr_ratio,
+            'loudness': user.loudness,
+            'naughtiness': user.naughtiness,
+        }} if CALCULATE_USER_RATIOS else {}),
+        **({'messages_by_feeling': dict(user.messages_by_feeling)} if ANALYZE_SENTIMENTS else {}),
+        **({'feeling_ratios': dict(user.feeling_ratios)} if ANALYZE_SENTIMENTS else {}),
+        'top_reactions_given': dict(user.reactions_given.most_common(USER_REACTION_LIMIT)),
+        'top_reactions_received': dict(user.reactions_received.most_common(USER_REACTION_LIMIT)),
+        'top_active_days': dict(user.daily_message_counter.most_common(USER_ACTIVE_DAYS_LIMIT)),
+        'hourly_activity': hour_of_week_to_dict(user.hourly_activity),
+        'top_categories': {k: dict(v.most_common(USER_CATEGORY_LIMIT)) for k, v in user.category_words.items()},
+        'top_words': vocabulary.to_words(user.word_counter.most_common(USER_WORD_LIMIT)),
+        **({'top_words_error_bound': user.word_counter.error_bound()} if USER_WORD_COUNTER_CAPACITY else {}),
+    }
 
 
-def save_user_stats(user_stats: dict[int, User]):
-    with open(user_stats_json, 'w', encoding='utf-8') as file:
-        limited_user_stats = {
-            user_id: {
-                'id': user.user_id,
-                'name': user.name,
-                'message_count': user.message_count,
-                'word_count': user.word_count,
-                'letter_count': user.letter_count,
-                'media_count': user.media_count,
-                'reactions_given_count': user.reactions_given_count,
-                'reactions_received_count': user.reactions_received_count,
-                'loud_word_count': user.loud_word_count,
-                'loud_message_count': user.loud_message_count,
-                'curse_count': user.curse_count,
-                **({'ratios': {
-                    'messages_per_active_day': user.messages_per_active_day,
-                    'messages_per_day': user.messages_per_day,
-                    'words_per_message': user.words_per_message,
-                    'media_per_message': user.media_per_message,
-                    'rg_ratio': user.rg_ratio,
-                    'rr_ratio': user.rr_ratio,
-                    'loudness': user.loudness,
-                    'naughtiness': user.naughtiness,
-                }} if CALCULATE_USER_RATIOS else {}),
-                **({'messages_by_feeling': dict(user.messages_by_feeling)} if ANALYZE_SENTIMENTS else {}),
-                **({'feeling_ratios': dict(user.feeling_ratios)} if ANALYZE_SENTIMENTS else {}),
-                'top_reactions_given': dict(user.reactions_given.most_common(USER_REACTION_LIMIT)),
-                'top_reactions_received': dict(user.reactions_received.most_common(USER_REACTION_LIMIT)),
-                'top_active_days': dict(user.daily_message_counter.most_common(USER_ACTIVE_DAYS_LIMIT)),
-                'top_categories': {k: dict(v.most_common(USER_CATEGORY_LIMIT)) for k, v in user.category_words.items()},
-                'top_words': dict(user.word_counter.most_common(USER_WORD_LIMIT))
-            }
-            for user_id, user in user_stats.items()
-        }
-        json.dump(limited_user_stats, file, indent=4, ensure_ascii=False)
+def dump_json(data, file):
+    json.dump(data, file, indent=None if COMPACT_JSON else 4, separators=(',', ':') if COMPACT_JSON else None, ensure_ascii=False)
+
+
+def json_item(key, value, first: bool) -> str:
+    """A `key: value` item of a json object written one item at a time, formatted the same as `dump_json` of the whole object."""
+    key = json.dumps(str(key), ensure_ascii=False)
+
+    if COMPACT_JSON:
+        return f"{'{' if first else ','}{key}:{json.dumps(value, separators=(',', ':'), ensure_ascii=False)}"
+
+    value = json.dumps(value, indent=4, ensure_ascii=False).replace('\n', '\n    ')
+    return f"{'{' if first else ','}\n    {key}: {value}"
+
+
+def export_users(user_stats: dict[int, User], vocabulary: Vocabulary, file):
+    """Writes user_stats.json one user at a time and yields the users.db row of every user."""
+    for i, (user_id, user) in enumerate(user_stats.items()):
+        stats = user_json_stats(user, vocabulary)
+        file.write(json_item(user_id, stats, first=not i))
+
+        yield (
+            user_id, user.name, 
+            user.message_count, user.word_count, user.letter_count, user.media_count, 
+            user.reactions_given_count, user.reactions_received_count, 
+            user.loud_word_count, user.loud_message_count,
+            user.curse_count,
+            user.messages_per_active_day,
+            user.messages_per_day, user.words_per_message, user.media_per_message, 
+            user.rg_ratio, user.rr_ratio,
+            user.loudness, user.naughtiness,
+            json.dumps(dict(user.messages_by_feeling)),
+            json.dumps(dict(user.feeling_ratios)),
+            json.dumps(stats['top_reactions_given']),
+            json.dumps(stats['top_reactions_received']),
+            json.dumps(stats['top_active_days']),
+            json.dumps(stats['top_categories']),
+            json.dumps(stats['top_words']),
+            json.dumps(stats['hourly_activity']),
+        )
+
+    if not user_stats:
+        file.write('{}')
+
+    else:
+        file.write('}' if COMPACT_JSON else '\n}')
+
 
+def save_user_stats(user_stats: dict[int, User], vocabulary: Vocabulary):
     conn = sqlite3.connect(user_stats_db)
     cursor = conn.cursor()
 
@@ -514,31 +913,21 @@ def save_user_stats(user_stats: dict[int, User]):
             top_reactions_received TEXT,
             top_active_days TEXT,
             top_categories TEXT,
-            top_words TEXT
+            top_words TEXT,
+            hourly_activity TEXT
         )
     ''')
 
-    for user_id, user in user_stats.items():
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id, user.name, 
-            user.message_count, user.word_count, user.letter_count, user.media_count, 
-            user.reactions_given_count, user.reactions_received_count, 
-            user.loud_word_count, user.loud_message_count,
-            user.curse_count,
-            user.messages_per_active_day,
-            user.messages_per_day, user.words_per_message, user.media_per_message, 
-            user.rg_ratio, user.rr_ratio,
-            user.loudness, user.naughtiness,
-            json.dumps(dict(user.messages_by_feeling)),
-            json.dumps(dict(user.feeling_ratios)),
-            json.dumps(dict(user.reactions_given.most_common(USER_REACTION_LIMIT))),
-            json.dumps(dict(user.reactions_received.most_common(USER_REACTION_LIMIT))),
-            json.dumps(dict(user.daily_message_counter.most_common(USER_ACTIVE_DAYS_LIMIT))),
-            json.dumps({k: dict(v.most_common(USER_CATEGORY_LIMIT)) for k, v in user.category_words.items()}),
-            json.dumps(dict(user.word_counter.most_common(USER_WORD_LIMIT))),
-        ))
+    # Tables created by older versions are missing the newer columns, which are always added at the end.
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(user_stats)')}
+    if 'hourly_activity' not in columns:
+        cursor.execute('ALTER TABLE user_stats ADD COLUMN hourly_activity TEXT')
+
+    # The json file and the database are written in the same pass over the users, and every row is inserted in a single transaction.
+    with open(user_stats_json, 'w', encoding='utf-8') as file:
+        cursor.executemany('''
+            INSERT OR REPLACE INTO user_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', export_users(user_stats, vocabulary, file))
 
     conn.commit()
     conn.close()
@@ -0,0 +1,273 @@
+"""
+A local stand-in for `telethon.TelegramClient`, used to exercise `fetch_group.py` and `get_all_words.py` without a Telegram account.
+
+`FakeTelegramClient` serves synthetic messages (`generate_messages`) or recorded ones (`load_messages` for a JSON fixture,
+`load_messages_from_db` for an existing messages.db), and can inject network latency and FloodWait errors.
+
+Run `python fake_telegram.py --help` to benchmark the fetch pipeline end to end against a synthetic group. The benchmark writes to a
+temporary folder and never touches the files configured in `res/config.py`, including the Telegram session file.
+"""
+
+import json
+import random
+import asyncio
+import sqlite3
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from telethon.errors import FloodWaitError
+from telethon.helpers import TotalList
+
+
+class FakeUser:
+    def __init__(self, user_id, first_name=None, last_name=None, username=None):
+        self.id = user_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.username = username
+
+
+class FakePeerUser:
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+
+class FakeReactionEmoji:
+    def __init__(self, emoticon):
+        self.emoticon = emoticon
+
+
+class FakeReaction:
+    def __init__(self, user_id, emoticon):
+        self.peer_id = FakePeerUser(user_id)
+        self.reaction = FakeReactionEmoji(emoticon)
+
+
+class FakeMessageReactions:
+    def __init__(self, recent_reactions):
+        self.recent_reactions = recent_reactions
+
+
+class FakeMessage:
+    def __init__(self, message_id, sender, text, date, media=False, reactions=()):
+        self.id = message_id
+        self.sender = sender  # None for system messages.
+        self.sender_id = sender.id if sender else None
+        self.text = text
+        self.date = date
+        self.media = object() if media else None
+        self.reactions = FakeMessageReactions([FakeReaction(user_id, emoticon) for user_id, emoticon in reactions]) if reactions else None
+
+
+WORDS = (
+    'the be to of and a in that have it for not on with he as you do at this but his by from they we say her she or an will my one all',
+    'hello thanks thank you good morning night yes no maybe lol apple banana google tesla dog cat red blue green usa canada uk',
+    'HELLO WOW NO YES 1 2 3 10 42 100 1000 café naïve über jalapeño São Paulo http://example.com/page https://t.me/group',
+)
+EMOTICONS = ('👍', '❤', '😂', '🔥', '😢', '👎', '🎉')
+
+
+def generate_messages(count, users=50, seed=0, start_date=datetime(2023, 1, 1, tzinfo=timezone.utc), system_message_ratio=0.01, media_ratio=0.1, reaction_ratio=0.3):
+    """Generates `count` reproducible messages sent by `users` synthetic users, with media flags, reactions and system messages."""
+    rng = random.Random(seed)
+    words = ' '.join(WORDS).split()
+    senders = [FakeUser(user_id, f'User{user_id}', f'Last{user_id}' if user_id % 3 else None, f'user{user_id}' if user_id % 5 else None) for user_id in range(1, users + 1)]
+    weights = [1 / rank for rank in range(1, users + 1)]  # A few users send most of the messages.
+    messages = []
+    date = start_date
+
+    for message_id in range(1, count + 1):
+        date += timedelta(seconds=rng.randint(1, 1200))
+
+        if rng.random() < system_message_ratio:
+            messages.append(FakeMessage(message_id, None, '', date))
+            continue
+
+        sender = rng.choices(senders, weights)[0]
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+        reactions = [(rng.choice(senders).id, rng.choice(EMOTICONS)) for _ in range(rng.randint(1, 4))] if rng.random() < reaction_ratio else ()
+        messages.append(FakeMessage(message_id, sender, text, date, rng.random() < media_ratio, reactions))
+
+    return messages
+
+
+def load_messages(path):
+    """
+    Loads recorded messages from a JSON file with a list of objects such as:
+    {"id": 1, "sender": {"id": 1, "first_name": "...", "last_name": null, "username": null}, "text": "...",
+     "date": "2024-01-01T12:00:00+00:00", "media": false, "reactions": [[2, "👍"]]}
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        records = json.load(file)
+
+    users = {}
+    messages = []
+
+    for record in records:
+        sender = record.get('sender')
+        if sender:
+            sender = users.setdefault(sender['id'], FakeUser(sender['id'], sender.get('first_name'), sender.get('last_name'), sender.get('username')))
+
+        date = datetime.fromisoformat(record['date'])
+        messages.append(FakeMessage(record['id'], sender, record.get('text', ''), date if date.tzinfo else date.replace(tzinfo=timezone.utc), record.get('media', False), record.get('reactions', ())))
+
+    return messages
+
+
+def load_messages_from_db(path):
+    """Loads recorded messages from an existing messages.db (schema version 2)."""
+    conn = sqlite3.connect(path)
+    users = {user_id: FakeUser(user_id, first_name, last_name, username) for user_id, first_name, last_name, username in conn.execute('SELECT user_id, first_name, last_name, username FROM users')}
+
+    reactions = {}
+    for message_id, user_id, emoticon in conn.execute('SELECT message_id, user_id, emoticon FROM reactions ORDER BY message_id, rowid'):
+        reactions.setdefault(message_id, []).append((user_id, emoticon))
+
+    messages = [
+        FakeMessage(message_id, users.get(sender_id), text, datetime.fromtimestamp(date, timezone.utc), media, reactions.get(message_id, ()))
+        for message_id, sender_id, text, date, media in conn.execute('SELECT message_id, sender_id, text, date, media FROM messages ORDER BY message_id')
+    ]
+    conn.close()
+
+    return messages
+
+
+class FakeTelegramClient:
+    """
+    Serves `messages` with the subset of the TelegramClient API used by this project.
+    `latency` seconds are awaited before every request, and every `flood_wait_every`-th request raises a FloodWaitError of `flood_wait_seconds`.
+    """
+
+    def __init__(self, messages, latency=0.0, flood_wait_every=0, flood_wait_seconds=1):
+        self.messages = sorted(messages, key=lambda message: message.id)
+        self.ids = [message.id for message in self.messages]
+        self.latency = latency
+        self.flood_wait_every = flood_wait_every
+        self.flood_wait_seconds = flood_wait_seconds
+        self.flood_sleep_threshold = 60
+        self.requests = 0
+        self.flood_waits = 0
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def is_user_authorized(self):
+        return True
+
+    async def send_code_request(self, phone):
+        pass
+
+    async def sign_in(self, phone, code):
+        pass
+
+    async def get_entity(self, entity):
+        return entity
+
+    async def _request(self):
+        # Taken before the wait, the counter is shared by the concurrent range fetchers.
+        number = self.requests = self.requests + 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.flood_wait_every and number % self.flood_wait_every == 0:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+
+    async def get_messages(self, entity, limit=None, *, min_id=0, max_id=0, reverse=False):
+        """Returns up to `limit` messages with `min_id < id < max_id`, oldest first if `reverse` else newest first."""
+        await self._request()
+
+        start = bisect_right(self.ids, min_id)
+        end = bisect_left(self.ids, max_id) if max_id else len(self.ids)
+        messages = self.messages[start:end]
+
+        if limit is not None:
+            messages = messages[:limit] if reverse else messages[len(messages) - limit:] if limit else []
+
+        result = TotalList(messages if reverse else reversed(messages))
+        result.total = len(self.messages)
+        return result
+
+    async def iter_messages(self, entity, limit=None, *, min_id=0, max_id=0, reverse=False):
+        page_size = 100
+        yielded = 0
+
+        while limit is None or yielded < limit:
+            page = await self.get_messages(entity, page_size if limit is None else min(page_size, limit - yielded), min_id=min_id, max_id=max_id, reverse=reverse)
+            if not page:
+                break
+
+            for message in page:
+                yield message
+
+            yielded += len(page)
+            if reverse:
+                min_id = page[-1].id
+
+            else:
+                max_id = page[-1].id
+
+
+async def benchmark_fetch(client):
+    import fetch_group
+
+    fetch_group.telegram_client = client
+    await fetch_group.fetch_messages()
+
+
+async def benchmark_words(client):
+    import get_all_words
+
+    get_all_words.telegram_client = client
+    await get_all_words.collect_word_stats()
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import time
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Benchmarks fetch_group.py or get_all_words.py against a local fake Telegram group.')
+    parser.add_argument('target', choices=('fetch', 'words'), nargs='?', default='fetch')
+    parser.add_argument('--messages', type=int, default=100000, help='Number of synthetic messages.')
+    parser.add_argument('--users', type=int, default=50, help='Number of synthetic users.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixture', help='Serve recorded messages from a JSON fixture or a messages.db instead of synthetic ones.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of simulated latency per request.')
+    parser.add_argument('--flood-wait-every', type=int, default=0, help='Raise a FloodWaitError every N requests.')
+    parser.add_argument('--flood-wait-seconds', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.fixture:
+        messages = load_messages_from_db(args.fixture) if args.fixture.endswith('.db') else load_messages(args.fixture)
+
+    else:
+        messages = generate_messages(args.messages, args.users, args.seed)
+
+    client = FakeTelegramClient(messages, args.latency, args.flood_wait_every, args.flood_wait_seconds)
+
+    # Redirect every output file of the scripts and the session file to a temporary folder before importing them.
+    import res.config as config
+
+    output_folder = tempfile.mkdtemp(prefix='telegram_benchmark_')
+    for name, value in list(vars(config).items()):
+        if isinstance(value, str) and name != 'output_folder' and value.startswith(f'{config.output_folder}/'):
+            setattr(config, name, os.path.join(output_folder, value[len(config.output_folder) + 1:]))
+
+    # fetch_group.py opens its TelegramClient on import, which would create or open the real session file.
+    config.session_file = os.path.join(output_folder, os.path.basename(config.session_file))
+    config.output_folder = output_folder
+    config.LOGOUT = False
+    sys.modules['res.config'] = config
+
+    start = time.time()
+    asyncio.run(benchmark_fetch(client) if args.target == 'fetch' else benchmark_words(client))
+    elapsed = time.time() - start
+
+    print(f'\n{len(messages)} messages in {elapsed:.2f} seconds ({len(messages) / elapsed:.1f} messages/s), {client.requests} requests, {client.flood_waits} FloodWaits.')
+    print(f'Output: {output_folder}')
@@ -1,12 +1,16 @@
 import os
+import ast
+import queue
 import sqlite3
 import asyncio
 import logging
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.tl.types import PeerUser
 from res.config import *
-import asyncio
 
 
 logging.basicConfig(level=logging.INFO)
@@ -14,14 +18,24 @@ logging.basicConfig(level=logging.INFO)
 
 telegram_client = TelegramClient(session_file, api_id, api_hash)
 
+SCHEMA_VERSION = 2
+EPOCH = datetime(1970, 1, 1)
+MAX_MESSAGE_ID = 2**63 - 1
+TEXT_FILTER = "AND text != ''"  # Messages without a text, such as media without a caption, are stored with an empty text.
+PUT_TIMEOUT = 0.1  # Seconds a fetcher waits on a full queue before checking whether the sink is closing.
+
 
 class Reaction:
+    __slots__ = ('peer_id', 'reaction')
+
     def __init__(self, peer_id, reaction):
         self.peer_id = peer_id
         self.reaction = reaction
 
 
 class Message:
+    __slots__ = ('id', 'sender_id', 'sender', 'text', 'date', 'media', 'reactions')
+
     def __init__(self, message_id, sender_id, sender, text, date, media, reactions):
         self.id = message_id
         self.sender_id = sender_id
@@ -33,6 +47,8 @@ class Message:
 
 
 class User:
+    __slots__ = ('id', 'first_name', 'last_name', 'username')
+
     def __init__(self, user_id, first_name=None, last_name=None, username=None):
         self.id = user_id
         self.first_name = first_name
@@ -46,52 +62,220 @@ class User:
         return self.first_name or self.username or "Unknown User"
     
 
-def process_message(message, conn, cursor):
+def configure_connection(conn):
+    conn.execute(f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+
+
+def process_message(message):
     user = message.sender
     text = message.text or ''
-    date = message.date.strftime('%Y-%m-%d %H:%M:%S')
+    date = int(message.date.timestamp())
     media = int(bool(message.media))
-    reactions = str([(reaction.peer_id.user_id, reaction.reaction.emoticon) for reaction in message.reactions.recent_reactions]) if message.reactions and message.reactions.recent_reactions else ''
+    reactions = message.reactions.recent_reactions if message.reactions and message.reactions.recent_reactions else []
+
+    message_row = (message.id, message.sender_id, text, date, media)
+    user_row = (user.id, user.first_name, user.last_name, user.username)
+    reaction_rows = [(message.id, reaction.peer_id.user_id, reaction.reaction.emoticon) for reaction in reactions]
+
+    return message_row, user_row, reaction_rows
+
+
+class MessageWriter:
+    """
+    Stages fetched messages in memory and writes them to the database in batches.
+    Every flush is a single transaction that also advances the checkpoints in the `meta` table (`last_message_id`, or one key per
+    id range when fetching in parallel), so an interrupted run resumes from the last committed batch.
+    """
+
+    def __init__(self, conn, commit_every=COMMIT_EVERY_PAGES):
+        self.conn = conn
+        self.commit_every = max(1, commit_every)
+        self.message_rows = []
+        self.user_rows = []
+        self.reaction_rows = []
+        self.staged_pages = 0
+        self.checkpoints = {}
+        self.dropped_checkpoints = set()
+        self.last_message_id = None
+
+        # Last known (first_name, last_name, username) of every sender, the users table is only written when these change.
+        self.known_users = {user_id: tuple(profile) for user_id, *profile in conn.execute('SELECT user_id, first_name, last_name, username FROM users')}
+        self.skipped_user_writes = 0
+
+    def stage(self, messages, checkpoint='last_message_id'):
+        for message in messages:
+            if message.sender:  # Ignore system messages.
+                message_row, user_row, reaction_rows = process_message(message)
+                self.message_rows.append(message_row)
+                self.reaction_rows.extend(reaction_rows)
+
+                user_id, *profile = user_row
+                if self.known_users.get(user_id) == tuple(profile):
+                    self.skipped_user_writes += 1
+
+                else:
+                    self.known_users[user_id] = tuple(profile)
+                    self.user_rows.append(user_row)
+
+        if messages:
+            self.set_checkpoint(checkpoint, messages[-1].id)
+
+        self.staged_pages += 1
+        if self.staged_pages >= self.commit_every:
+            self.flush()
+
+    def set_checkpoint(self, key, value):
+        self.checkpoints[key] = value
+        self.dropped_checkpoints.discard(key)
+
+    def drop_checkpoint(self, key):
+        self.checkpoints.pop(key, None)
+        self.dropped_checkpoints.add(key)
+
+    def flush(self):
+        if not (self.message_rows or self.checkpoints or self.dropped_checkpoints):
+            return
+
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO messages (message_id, sender_id, text, date, media)
+                VALUES (?, ?, ?, ?, ?)
+            ''', self.message_rows)
+
+            # Re-fetched messages replace their previous reactions.
+            self.conn.executemany('DELETE FROM reactions WHERE message_id = ?', ((row[0],) for row in self.message_rows))
+            self.conn.executemany('''
+                INSERT INTO reactions (message_id, user_id, emoticon)
+                VALUES (?, ?, ?)
+            ''', self.reaction_rows)
+
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO users (user_id, first_name, last_name, username)
+                VALUES (?, ?, ?, ?)
+            ''', self.user_rows)
+
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO meta (key, value)
+                VALUES (?, ?)
+            ''', self.checkpoints.items())
+
+            self.conn.executemany('DELETE FROM meta WHERE key = ?', ((key,) for key in self.dropped_checkpoints))
+
+        self.last_message_id = self.checkpoints.get('last_message_id', self.last_message_id)
+        self.message_rows.clear()
+        self.user_rows.clear()
+        self.reaction_rows.clear()
+        self.staged_pages = 0
+        self.checkpoints.clear()
+        self.dropped_checkpoints.clear()
+
+
+class DatabaseSink(threading.Thread):
+    """
+    Writer thread that owns the write connection to messages.db and drains fetched pages from a bounded queue.
+    The queue applies backpressure: the fetchers wait once `FETCH_QUEUE_SIZE` pages are pending.
+    All fetchers share a single sink, so every write to the db is serialized through this thread.
+    """
+
+    def __init__(self, maxsize=FETCH_QUEUE_SIZE):
+        super().__init__(name='DatabaseSink', daemon=True)
+        self.queue = queue.Queue(maxsize=max(1, maxsize))
+        self.last_message_id = None
+        self.skipped_user_writes = 0
+        self.error = None
+        self.closing = False  # Set by close(), the fetchers stop queuing once the writer is about to exit.
+
+    def run(self):
+        conn = writer = None
+        closed = False  # Whether close() was already received.
+
+        try:
+            conn = sqlite3.connect(messages_db)
+            configure_connection(conn)
+            writer = MessageWriter(conn)
+
+            while (item := self.queue.get()) is not None:
+                if self.error:  # Keep draining so the fetchers never block on a dead writer.
+                    continue
+
+                method, args = item
+                try:
+                    getattr(writer, method)(*args)
+
+                except Exception as e:
+                    self.error = e
+
+            closed = True
+            if not self.error:
+                writer.flush()
 
-    cursor.execute('''
-        INSERT OR REPLACE INTO messages (message_id, sender_id, text, date, media, reactions)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (message.id, message.sender_id, text, date, media, reactions))
+        except Exception as e:
+            self.error = e
 
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (user_id, first_name, last_name, username)
-        VALUES (?, ?, ?, ?)
-    ''', (user.id, user.first_name, user.last_name, user.username))
+        finally:
+            if writer:
+                self.last_message_id = writer.last_message_id
+                self.skipped_user_writes = writer.skipped_user_writes
 
-    cursor.execute('''
-        INSERT OR REPLACE INTO meta (key, value)
-        VALUES ("last_message_id", ?)
-    ''', (message.id,))
+            if conn:
+                conn.close()
 
-    cursor.execute('UPDATE meta SET value = ? WHERE key = "last_message_id"', (message.id,))
+            # A failed setup never reached the loop, the queue is still drained until close() so the fetchers and close() never block.
+            while not closed and self.queue.get() is not None:
+                pass
 
-    conn.commit()
+    def _put_blocking(self, item):
+        # Waits in short steps, so a fetcher that is still queuing when close() starts never blocks on a writer that exited.
+        while not self.closing:
+            try:
+                self.queue.put(item, timeout=PUT_TIMEOUT)
+                return True
 
+            except queue.Full:
+                pass
 
-async def fetch_messages():
-    await telegram_client.connect()
+        return False
 
-    if not await telegram_client.is_user_authorized():
-        await telegram_client.send_code_request(telegram_phone)
-        await telegram_client.sign_in(telegram_phone, input('Enter the code you received on Telegram: '))
+    async def _put(self, item):
+        queued = await asyncio.to_thread(self._put_blocking, item)
 
-    group_entity = await telegram_client.get_entity(telegram_group_id)
+        if self.error:
+            raise self.error
 
-    conn = sqlite3.connect(messages_db)
+        if not queued:
+            raise RuntimeError('The database sink was closed while messages were still being fetched.')
+
+    async def put(self, messages, checkpoint='last_message_id'):
+        await self._put(('stage', (messages, checkpoint)))
+
+    async def set_checkpoint(self, key, value):
+        await self._put(('set_checkpoint', (key, value)))
+
+    async def drop_checkpoint(self, key):
+        await self._put(('drop_checkpoint', (key,)))
+
+    async def close(self):
+        self.closing = True
+        await asyncio.to_thread(self.queue.put, None)
+        await asyncio.to_thread(self.join)
+
+        if self.error:
+            raise self.error
+
+
+def init_database(conn):
     cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM sqlite_master WHERE type = "table" AND name = "messages"')
+    existing_database = cursor.fetchone() is not None
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS messages (
             message_id INTEGER PRIMARY KEY,
             sender_id INTEGER,
             text TEXT,
-            date TEXT,
-            media INTEGER,
-            reactions TEXT
+            date INTEGER,  -- Unix timestamp (UTC).
+            media INTEGER
         )
     ''')
 
@@ -111,67 +295,422 @@ async def fetch_messages():
         )
     ''')
 
-    if SHOW_PROGRESS_BAR:
-        latest_message = await telegram_client.get_messages(group_entity, limit=1)
-        first_message = await telegram_client.get_messages(group_entity, limit=1, reverse=True)
-
-        latest_message_id = latest_message[0].id if latest_message else 0
-        first_message_id = first_message[0].id if first_message else 0
-        processed_messages = 0
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reactions (
+            message_id INTEGER,
+            user_id INTEGER,
+            emoticon TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS reactions_message_id ON reactions (message_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS reactions_user_id ON reactions (user_id)')
 
-    cursor.execute('SELECT value FROM meta WHERE key = "last_message_id"')
+    cursor.execute('SELECT value FROM meta WHERE key = "schema_version"')
     row = cursor.fetchone()
-    last_message_id = int(row[0]) if row else 0
+    schema_version = int(row[0]) if row else (1 if existing_database else SCHEMA_VERSION)
+
+    if schema_version < 2:
+        migrate_to_v2(conn)
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS messages_sender_id_date ON messages (sender_id, date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS messages_date ON messages (date)')
 
-    batch_size = 100
-    min_id = last_message_id
+    if not row or schema_version != SCHEMA_VERSION:
+        cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES ("schema_version", ?)', (SCHEMA_VERSION,))
 
+    conn.commit()
+
+
+def get_schema_version(conn):
+    try:
+        row = conn.execute('SELECT value FROM meta WHERE key = "schema_version"').fetchone()
+
+    except sqlite3.OperationalError:  # No meta table, written by the first versions of fetch_group.py.
+        return None
+
+    return int(row[0]) if row else None
+
+
+def open_database():
+    """
+    Opens messages.db for reading. A database written by an older version is migrated first, an up to date one is never written to,
+    so reading does not wait for a running fetch_group.py.
+    """
+    if not os.path.exists(messages_db):
+        raise FileNotFoundError(f'{messages_db} does not exist, run fetch_group.py first.')
+
+    conn = sqlite3.connect(messages_db)
+
+    if get_schema_version(conn) != SCHEMA_VERSION:
+        init_database(conn)
+
+    return conn
+
+
+def migrate_reactions(conn):
+    """Moves reactions stored as `str([(user_id, emoticon), ...])` in the `messages` table of older databases into the `reactions` table."""
+    rows = conn.execute('SELECT message_id, reactions FROM messages WHERE reactions IS NOT NULL AND reactions != ""').fetchall()
+    if not rows:
+        return
+
+    logging.info(f'Migrating the reactions of {len(rows)} messages...')
+
+    conn.execute('DELETE FROM reactions WHERE message_id IN (SELECT message_id FROM messages WHERE reactions IS NOT NULL AND reactions != "")')
+    conn.executemany('''
+        INSERT INTO reactions (message_id, user_id, emoticon)
+        VALUES (?, ?, ?)
+    ''', ((message_id, user_id, emoticon) for message_id, reactions in rows for user_id, emoticon in ast.literal_eval(reactions)))
+
+
+def migrate_to_v2(conn):
+    """
+    Schema version 2 moves reactions into their own table and stores dates as integer Unix timestamps instead of
+    '%Y-%m-%d %H:%M:%S' strings. The `messages` table is rebuilt in place, in a single transaction.
+    """
+    logging.info('Migrating messages.db to schema version 2...')
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage the transaction manually so the table rebuild is atomic.
+
+    try:
+        conn.execute('BEGIN')
+
+        if 'reactions' in {column[1] for column in conn.execute('PRAGMA table_info(messages)')}:
+            migrate_reactions(conn)
+
+        conn.execute('''
+            CREATE TABLE messages_v2 (
+                message_id INTEGER PRIMARY KEY,
+                sender_id INTEGER,
+                text TEXT,
+                date INTEGER,  -- Unix timestamp (UTC).
+                media INTEGER
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO messages_v2 (message_id, sender_id, text, date, media)
+            SELECT message_id, sender_id, text, CAST(strftime('%s', date) AS INTEGER), media FROM messages
+        ''')
+        conn.execute('DROP TABLE messages')
+        conn.execute('ALTER TABLE messages_v2 RENAME TO messages')
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES ("schema_version", 2)')
+        conn.execute('COMMIT')
+
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def split_ranges(min_id, max_id, count):
+    """Splits the ids in `(min_id, max_id]` into `count` contiguous ranges of `(start, end)` with the same semantics."""
+    size = -(-(max_id - min_id) // count)
+    return [(start, min(start + size, max_id)) for start in range(min_id, max_id, size)]
+
+
+def load_range_checkpoints(conn):
+    """Returns the unfinished ranges of an interrupted parallel fetch as `{key: (cursor, end)}`."""
+    ranges = {}
+
+    for key, value in conn.execute('SELECT key, value FROM meta WHERE key LIKE "range:%"'):
+        _, _, end = key.split(':')
+        ranges[key] = (int(value), int(end))
+
+    return ranges
+
+
+class RequestScheduler:
+    """
+    Paces the `get_messages` calls of every fetcher against Telegram's rate limits.
+    On a FloodWait, all fetchers sleep for exactly the requested time, the page size is halved and requests are spaced out.
+    Each successful request grows the page size back towards `FETCH_MAX_BATCH_SIZE` and shortens the spacing again.
+    """
+
+    def __init__(self, min_batch_size=FETCH_MIN_BATCH_SIZE, max_batch_size=FETCH_MAX_BATCH_SIZE):
+        self.min_batch_size = max(1, min(min_batch_size, max_batch_size))
+        self.max_batch_size = max_batch_size
+        self.batch_size = max_batch_size
+        self.interval = 0.0
+        self.resume_at = 0.0
+        self.started_at = time.monotonic()
+        self.fetched_messages = 0
+        self.flood_waits = 0
+        self.waited_seconds = 0
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.fetched_messages / elapsed if elapsed else 0
+
+    async def get_messages(self, *args, limit=None, **kwargs):
+        """Requests a page of `limit` messages, or of the current adaptive page size if `limit` is None."""
+        while True:
+            delay = self.resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self.resume_at = max(self.resume_at, time.monotonic()) + self.interval
+
+            try:
+                messages = await telegram_client.get_messages(*args, limit=limit or self.batch_size, **kwargs)
+
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                self.waited_seconds += e.seconds
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                self.interval = min(60.0, max(0.5, self.interval * 2))
+                self.resume_at = max(self.resume_at, time.monotonic() + e.seconds)
+                logging.warning(f'FloodWait: sleeping for {e.seconds} seconds, page size lowered to {self.batch_size}.')
+                continue
+
+            if limit is None:
+                self.fetched_messages += len(messages)
+
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.min_batch_size)
+            self.interval = self.interval / 2 if self.interval > 0.05 else 0.0
+            return messages
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started_at
+        return f'Fetched {self.fetched_messages} messages in {elapsed:.2f} seconds ({self.rate:.1f} messages/s), {self.flood_waits} FloodWaits ({self.waited_seconds} seconds).'
+
+
+async def fetch_range(group_entity, scheduler, sink, checkpoint, min_id, max_id=None, on_page=None):
+    """Fetches the messages with `min_id < id <= max_id` in ascending order, without an upper bound if `max_id` is None."""
     while True:
-        messages = await telegram_client.get_messages(group_entity, min_id=min_id, limit=batch_size, reverse=True)
+        messages = await scheduler.get_messages(group_entity, min_id=min_id, max_id=max_id + 1 if max_id else 0, reverse=True)
         if not messages:
             break
 
-        for message in messages:
-            if not message.sender:  # Ignore system messages.
-                continue
+        # The sink writes this page while the next one is being fetched.
+        await sink.put(messages, checkpoint)
+        min_id = messages[-1].id
 
-            process_message(message, conn, cursor)
-            processed_messages += 1
+        if on_page:
+            on_page(checkpoint, min_id)
 
-            if SHOW_PROGRESS_BAR:
-                if latest_message_id and first_message_id:  # Avoid division by zero for the first message.
-                    percentage = round(((message.id - first_message_id) / (latest_message_id - first_message_id)) * 100, 2)
-                    print(f'\rProcessed Messages: [{message.id - first_message_id} / {latest_message_id - first_message_id}] [{percentage}%]', end='')
 
-            min_id = message.id
+async def fetch_messages():
+    await telegram_client.connect()
 
-    if SHOW_PROGRESS_BAR:
-        print()
+    if not await telegram_client.is_user_authorized():
+        await telegram_client.send_code_request(telegram_phone)
+        await telegram_client.sign_in(telegram_phone, input('Enter the code you received on Telegram: '))
 
-    logging.info('Closing Database and disconnecting from Telegram...')
-    conn.close()
-    await telegram_client.disconnect()
+    group_entity = await telegram_client.get_entity(telegram_group_id)
 
+    # Let the scheduler handle every FloodWait instead of Telethon sleeping silently on the short ones.
+    telegram_client.flood_sleep_threshold = 0
+    scheduler = RequestScheduler()
 
-def get_messages():
     conn = sqlite3.connect(messages_db)
+    configure_connection(conn)
+    init_database(conn)
+
+    cursor = conn.cursor()
+    cursor.execute('SELECT value FROM meta WHERE key = "last_message_id"')
+    row = cursor.fetchone()
+    last_message_id = int(row[0]) if row else 0
+
+    latest_message = await scheduler.get_messages(group_entity, limit=1)
+    latest_message_id = latest_message[0].id if latest_message else 0
+
+    # Ranges left over from an interrupted parallel fetch are resumed before anything else.
+    ranges = load_range_checkpoints(conn)
+
+    if not ranges and FETCH_PARALLEL_RANGES > 1 and latest_message_id - last_message_id > 100 * FETCH_PARALLEL_RANGES:
+        if not last_message_id:
+            first_message = await scheduler.get_messages(group_entity, limit=1, reverse=True)
+            last_message_id = first_message[0].id - 1 if first_message else 0
+
+        ranges = {f'range:{start}:{end}': (start, end) for start, end in split_ranges(last_message_id, latest_message_id, FETCH_PARALLEL_RANGES)}
+
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ((key, cursor) for key, (cursor, _) in ranges.items()))
+
+    conn.close()
+
+    # Every range is tracked as (start, cursor, end) for the progress bar, including the sequential tail after the ranges.
+    tail_start = max([last_message_id] + [end for _, end in ranges.values()])
+    progress = {key: [cursor, cursor, end] for key, (cursor, end) in ranges.items()}
+    progress['last_message_id'] = [tail_start, tail_start, max(tail_start, latest_message_id)]
+
+    def show_progress(checkpoint, message_id):
+        progress[checkpoint][1] = message_id
+        total = sum(end - start for start, _, end in progress.values())
+        done = sum(min(cursor, end) - start for start, cursor, end in progress.values())
+
+        if total:
+            print(f'\rProcessed Messages: [{done} / {total}] [{round(done / total * 100, 2)}%] [{scheduler.rate:.1f} messages/s]', end='')
+
+    on_page = show_progress if SHOW_PROGRESS_BAR else None
+    sink = DatabaseSink()
+    sink.start()
+
+    try:
+        if ranges:
+            logging.info(f'Fetching {len(ranges)} message ranges in parallel...')
+            tasks = [asyncio.create_task(fetch_range(group_entity, scheduler, sink, key, cursor, end, on_page)) for key, (cursor, end) in ranges.items()]
+
+            try:
+                await asyncio.gather(*tasks)
+
+            except BaseException:
+                # One range failed, the others are stopped before the sink is closed. Their checkpoints are resumed on the next run.
+                for task in tasks:
+                    task.cancel()
+
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            # Every range is complete, the checkpoints collapse into `last_message_id`.
+            for key in ranges:
+                await sink.drop_checkpoint(key)
+
+            await sink.set_checkpoint('last_message_id', tail_start)
+
+        await fetch_range(group_entity, scheduler, sink, 'last_message_id', tail_start, on_page=on_page)
+
+    finally:
+        if SHOW_PROGRESS_BAR:
+            print()
+
+        logging.info('Flushing pending messages, closing Database and disconnecting from Telegram...')
+        try:
+            await sink.close()
+
+        finally:
+            if sink.last_message_id is not None:
+                logging.info(f'Last committed message: {sink.last_message_id}')
+
+            logging.info(scheduler.summary())
+            logging.info(f'Skipped {sink.skipped_user_writes} unchanged user profile writes.')
+
+            await telegram_client.disconnect()
+
+
+def count_messages(min_id=0, max_id=MAX_MESSAGE_ID, text_only=False):
+    conn = open_database()
+    count = conn.execute(f"SELECT COUNT(*) FROM messages WHERE message_id > ? AND message_id <= ? {TEXT_FILTER if text_only else ''}", (min_id, max_id)).fetchone()[0]
+    conn.close()
+
+    return count
+
+
+def split_message_ranges(count, min_id=0, max_id=MAX_MESSAGE_ID):
+    """Splits the messages with `min_id < id <= max_id` into up to `count` consecutive `(min_id, max_id)` ranges holding about as many messages each."""
+    conn = open_database()
+    total = conn.execute('SELECT COUNT(*) FROM messages WHERE message_id > ? AND message_id <= ?', (min_id, max_id)).fetchone()[0]
+    bounds = [min_id]
+
+    for i in range(1, count):
+        offset = total * i // count - 1
+        if offset < 0:
+            continue
+
+        row = conn.execute('SELECT message_id FROM messages WHERE message_id > ? AND message_id <= ? ORDER BY message_id LIMIT 1 OFFSET ?', (min_id, max_id, offset)).fetchone()
+        if row and row[0] > bounds[-1]:
+            bounds.append(row[0])
+
+    conn.close()
+    bounds.append(max_id)
+
+    return list(zip(bounds, bounds[1:]))
+
+
+def get_committed_message_id():
+    """
+    Returns the id up to which the history in messages.db is complete.
+    While a parallel fetch is unfinished, messages above the lowest range checkpoint may still be missing.
+    """
+    conn = open_database()
+    ranges = load_range_checkpoints(conn)
+    message_id = min(cursor for cursor, _ in ranges.values()) if ranges else conn.execute('SELECT COALESCE(MAX(message_id), 0) FROM messages').fetchone()[0]
+    conn.close()
+
+    return message_id
+
+
+def load_users(conn):
+    return {user_id: User(user_id, first_name, last_name, username) for user_id, first_name, last_name, username in conn.execute('SELECT user_id, first_name, last_name, username FROM users')}
+
+
+def get_users():
+    conn = open_database()
+    users = load_users(conn)
+    conn.close()
+
+    return users
+
+
+def get_messages(with_reactions=True, chunk_size=READ_CHUNK_SIZE, min_id=0, max_id=MAX_MESSAGE_ID, text_only=False):
+    """
+    Streams the messages with `min_id < id <= max_id` in ascending order, only the ones with a text if `text_only`.
+    Rows are read `chunk_size` at a time so memory does not grow with the size of the group.
+    """
+    conn = open_database()
     cursor = conn.cursor()
+    users = load_users(conn)
+
+    # Reactions are read alongside the messages, both cursors are ordered by message_id.
+    reaction_rows = iter(conn.execute('SELECT message_id, user_id, emoticon FROM reactions WHERE message_id > ? AND message_id <= ? ORDER BY message_id, rowid', (min_id, max_id)) if with_reactions else ())
+    next_reaction = next(reaction_rows, None)
+
+    cursor.execute(f"SELECT message_id, sender_id, text, date, media FROM messages WHERE message_id > ? AND message_id <= ? {TEXT_FILTER if text_only else ''} ORDER BY message_id ASC", (min_id, max_id))
+    while rows := cursor.fetchmany(chunk_size):
+        for message_id, sender_id, text, date, media in rows:
+            while next_reaction and next_reaction[0] < message_id:
+                next_reaction = next(reaction_rows, None)
+
+            reactions = []
+            while next_reaction and next_reaction[0] == message_id:
+                reactions.append(Reaction(PeerUser(next_reaction[1]), next_reaction[2]))
+                next_reaction = next(reaction_rows, None)
+
+            yield Message(message_id, sender_id, users[sender_id], text, EPOCH + timedelta(seconds=date), media, reactions)
+
+    conn.close()
+
+
+def get_activity_counts(min_id=0, max_id=MAX_MESSAGE_ID):
+    """
+    Yields `(sender_id, hour, message count, media count)` for every hour in which `sender_id` sent messages with `min_id < id <= max_id`.
+    `hour` is the number of hours since 1970-01-01 (UTC). Rows are ordered by the first message of every sender and hour, the text is never read.
+    """
+    conn = open_database()
+
+    yield from conn.execute('''
+        SELECT sender_id, date / 3600 AS hour, COUNT(*), SUM(media)
+        FROM messages
+        WHERE sender_id IS NOT NULL AND message_id > ? AND message_id <= ?
+        GROUP BY sender_id, hour
+        ORDER BY MIN(message_id)
+    ''', (min_id, max_id))
+
+    conn.close()
+
 
-    cursor.execute('SELECT user_id, first_name, last_name, username FROM users')
-    users = {user_id: User(user_id, first_name, last_name, username) for user_id, first_name, last_name, username in cursor.fetchall()}
+def get_reaction_counts(min_id=0, max_id=MAX_MESSAGE_ID):
+    """
+    Yields `(sender_id, user_id, emoticon, count)` for every reaction given by `user_id` to the messages of `sender_id`, for the messages with `min_id < id <= max_id`.
+    Rows are ordered by the first message that received them.
+    """
+    conn = open_database()
 
-    cursor.execute('SELECT message_id, sender_id, text, date, media, reactions FROM messages ORDER BY message_id ASC')
-    for row in cursor.fetchall():
-        message_id, sender_id, text, date, media, reactions = row
-        date = datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
-        reactions = [Reaction(PeerUser(peer_id), reaction) for peer_id, reaction in eval(reactions)] if reactions else []
-        yield Message(message_id, sender_id, users[sender_id], text, date, media, reactions)
+    yield from conn.execute('''
+        SELECT messages.sender_id, reactions.user_id, reactions.emoticon, COUNT(*)
+        FROM reactions JOIN messages ON messages.message_id = reactions.message_id
+        WHERE messages.sender_id IS NOT NULL AND messages.message_id > ? AND messages.message_id <= ?
+        GROUP BY messages.sender_id, reactions.user_id, reactions.emoticon
+        ORDER BY MIN(reactions.message_id), MIN(reactions.rowid)
+    ''', (min_id, max_id))
 
     conn.close()
 
 
 if __name__ == '__main__':
-    import time
     start = time.time()
 
     try:
@@ -180,11 +719,9 @@ if __name__ == '__main__':
 
     except KeyboardInterrupt:
         print('\n[ Program Interrupted. ]')
-        print('There is a chance that the last message would be duplicated, please check the last entry after running the script again.')
 
     except Exception as e:
         print(f'\n[ Error: {e} ]')
-        print('There is a chance that the last message would be duplicated, please check the last entry after running the script again.')
 
     else:
         print('\n[ Program Finished. ]')
@@ -1,24 +1,23 @@
 import os
 import json
 import asyncio
-import re
+from contextlib import nullcontext
 from collections import Counter
 
 from telethon import TelegramClient
 from res.config import *
-
-
-if CONVERT_UNICODE:
-    from unidecode import unidecode
+from tokenizer import Tokenizer
+from text_normalizer import URL_PATTERN, TextNormalizer
+from channel_log import ChannelLog
 
 
 if not os.path.exists(output_folder):
     os.makedirs(output_folder)
 
 
-if GET_CHANNEL_LOG:
-    with open(log_channel_file, 'w', encoding='utf-8') as file:
-        file.write('')
+TOKENIZE_BATCH_SIZE = 1000  # Messages are tokenized in batches, one regex pass per batch.
+tokenizer = Tokenizer()
+text_normalizer = TextNormalizer(CONVERT_UNICODE)
 
 
 async def collect_word_stats():
@@ -31,53 +30,57 @@ async def collect_word_stats():
     group_entity = await telegram_client.get_entity(telegram_group_id)
 
     all_words = Counter()
-    all_words_lower = Counter()
+    texts = []
 
     total_messages = (await telegram_client.get_messages(group_entity, limit=0)).total
     processed_messages = 0
 
-    async for message in telegram_client.iter_messages(group_entity):
-        if message.text:
-            if CONVERT_UNICODE:
-                text = unidecode(message.text)  # Convert Unicode characters to ASCII
-
-            else:
-                text = message.text.encode('utf-8', errors='replace').decode('utf-8')
-
-            if IGNORE_URLS:
-                text = re.sub(r'http\S+', ' ', text)
-
-            if GET_CHANNEL_LOG:
-                if message.sender:
-                    if message.sender.first_name:
-                        name = message.sender.first_name + (' ' + message.sender.last_name if message.sender.last_name else '')
-                    elif message.sender.username:
-                        name = message.sender.username
+    # Messages are fetched newest first, the log is always rewritten. It is closed and flushed even if the run is interrupted.
+    with ChannelLog(log_channel_file, CHANNEL_LOG_COMPRESSION) if GET_CHANNEL_LOG else nullcontext() as channel_log:
+        async for message in telegram_client.iter_messages(group_entity):
+            if message.text:
+                text = text_normalizer.transliterate(message.text)
+
+                if IGNORE_URLS:
+                    text = URL_PATTERN.sub(' ', text)
+
+                if channel_log:
+                    if message.sender:
+                        if message.sender.first_name:
+                            name = message.sender.first_name + (' ' + message.sender.last_name if message.sender.last_name else '')
+                        elif message.sender.username:
+                            name = message.sender.username
+                        else:
+                            name = 'Unknown User'
                     else:
                         name = 'Unknown User'
-                else:
-                    name = 'Unknown User'
                     
-                if SHOW_DATE:
-                    date_str = message.date.strftime('%Y-%m-%d %H:%M:%S')
-                    text = f'[ {date_str} ] <{name}> {text}\n'
+                    if SHOW_DATE:
+                        date_str = message.date.strftime('%Y-%m-%d %H:%M:%S')
+                        line = f'[ {date_str} ] <{name}> {text}\n'
 
-                else:
-                    text = f'<{name}> {text}\n'
-
-                with open(log_channel_file, 'a', encoding='utf-8') as file:
-                    file.write(text)
+                    else:
+                        line = f'<{name}> {text}\n'
 
-            words = re.findall(r'\b\w+\b', text)
+                    channel_log.write(message.id, line)
 
-            all_words.update(words)
-            all_words_lower.update(word.lower() for word in words)
+                texts.append(text)
+                if len(texts) >= TOKENIZE_BATCH_SIZE:
+                    all_words.update(tokenizer.count(texts))
+                    texts = []
 
-        processed_messages += 1
-        print(f'\rProcessed Messages: [{processed_messages} / {total_messages}]', end='')
+            processed_messages += 1
+            print(f'\rProcessed Messages: [{processed_messages} / {total_messages}]', end='')
 
     await telegram_client.disconnect()
 
+    all_words.update(tokenizer.count(texts))
+
+    # Every lowercase word first appears with the first of its spellings, so the counts keep the same order.
+    all_words_lower = Counter()
+    for word, count in all_words.items():
+        all_words_lower[word.lower()] += count
+
     print()
 
     save_word_stats_json(sensitive_freq_json, dict(sorted(all_words.items(), key=lambda x: x[1], reverse=True)))
@@ -14,6 +14,7 @@ else:
 # Choose what graphs to generate.
 GENERATE_ACTIVITY_GIF = True
 GENERATE_ACTIVITY_PNG = True
+GENERATE_HOURLY_HEATMAP = True
 GENERATE_CATEGORY_HISTOGRAM_GIFS = True
 GENERATE_CATEGORY_HISTOGRAM_PNGS = True
 GENERATE_METRICS_RADAR = True
@@ -61,6 +62,20 @@ ACTIVITY_PARAMS = {
     'ANIMATION_MAX_FRAMES': 200, 
 }
 
+HEATMAP_PARAMS = {
+    'FIGURE_SIZE': (9.6, 5.4),
+    'GRAPH_BACKGROUND_COLOR': 'white',
+    'TEXT_COLOR': 'black',
+    'COLORMAP': 'YlOrRd',  # Matplotlib colormap for the cells.
+
+    'TITLE': '{name} - Activity by Hour',  # Can be set to None. Vars: {name}, {id}
+    'X_LABEL': 'Hour (UTC)',  # Hours are collected in UTC.
+    'Y_LABEL': None,
+
+    'SHOW_VALUES': False,  # Write the amount of messages in every cell.
+    'SHOW_PEAK_HOUR': True,  # Show the most active weekday and hour under the graph.
+}
+
 CATEGORY_PARAMS = {
     'FIGURE_SIZE': (9.6, 5.4),
     'GRAPH_COLOR': 'blue',
@@ -1,7 +1,7 @@
 import os
 import json
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -159,6 +159,17 @@ def radar_factory(num_vars, frame='circle'):
     return theta
 
 
+def daily_message_counts(activity_data):
+    """Returns the first day and the number of messages of every day since then, from `{'YYYY-MM-DD': count}`."""
+    days = np.array(list(activity_data.keys()), dtype='datetime64[D]')
+    start_date = days.min()
+
+    message_counts = np.zeros((days.max() - start_date).astype(int) + 1, dtype=int)
+    np.add.at(message_counts, (days - start_date).astype(int), list(activity_data.values()))
+
+    return start_date.item(), message_counts
+
+
 def create_activity_animation(
     user_id, 
     user_data, 
@@ -196,19 +207,10 @@ def create_activity_animation(
     # Getting the activity data
     activity_data = user_data['top_active_days']
     activity_factor = activity_factor or 1
-    start_date = min(activity_data.keys())
-    start_date_dt = datetime.strptime(start_date, '%Y-%m-%d')
-    end_date_dt = datetime.strptime(max(activity_data.keys()), '%Y-%m-%d')
     
     # Daily message counts
-    current_date = start_date_dt
-    date_list = []
-    message_counts = []
-    while current_date <= end_date_dt:
-        date_str = current_date.strftime('%Y-%m-%d')
-        date_list.append((current_date - start_date_dt).days)
-        message_counts.append(activity_data.get(date_str, 0))
-        current_date += timedelta(days=1)
+    start_date_dt, message_counts = daily_message_counts(activity_data)
+    date_list = np.arange(len(message_counts))
     
     # Figure and axes
     fig, ax = plt.subplots(figsize=figure_size)
@@ -334,19 +336,10 @@ def create_activity_static(
     # Getting the activity data
     activity_data = user_data['top_active_days']
     activity_factor = activity_factor or 1
-    start_date = min(activity_data.keys())
-    start_date_dt = datetime.strptime(start_date, '%Y-%m-%d')
-    end_date_dt = datetime.strptime(max(activity_data.keys()), '%Y-%m-%d')
     
     # Daily message counts
-    current_date = start_date_dt
-    date_list = []
-    message_counts = []
-    while current_date <= end_date_dt:
-        date_str = current_date.strftime('%Y-%m-%d')
-        date_list.append((current_date - start_date_dt).days)
-        message_counts.append(activity_data.get(date_str, 0))
-        current_date += timedelta(days=1)
+    start_date_dt, message_counts = daily_message_counts(activity_data)
+    date_list = np.arange(len(message_counts))
     
     # Figure and axes
     fig, ax = plt.subplots(figsize=figure_size)
@@ -415,6 +408,68 @@ def create_activity_static(
         plt.close(fig)
 
 
+def create_hourly_heatmap(
+    user_id, 
+    user_data, 
+    static_graphs_folder,
+    *,
+    figure_size=(9.6, 5.4),
+    graph_background_color='white',
+    text_color='black',
+    colormap='YlOrRd',
+    x_label='Hour (UTC)',
+    y_label=None,
+    title='{name} - Activity by Hour',
+    show_values=False,
+    show_peak_hour=True
+):
+    hourly_data = user_data.get('hourly_activity')
+    if not hourly_data:
+        return
+
+    weekdays = list(hourly_data.keys())
+    message_counts = np.array(list(hourly_data.values()))
+    
+    fig, ax = plt.subplots(figsize=figure_size)
+    fig.patch.set_facecolor(graph_background_color)
+    ax.set_facecolor(graph_background_color)
+
+    image = ax.imshow(message_counts, cmap=colormap, aspect='auto')
+    colorbar = fig.colorbar(image, ax=ax)
+    colorbar.ax.tick_params(colors=text_color)
+
+    ax.set_xticks(range(24))
+    ax.set_yticks(range(len(weekdays)))
+    ax.set_yticklabels([weekday[:3] for weekday in weekdays])
+    ax.tick_params(axis='both', colors=text_color, length=0)
+
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    ax.set_xlabel(x_label, color=text_color)
+    ax.set_ylabel(y_label, color=text_color)
+
+    if title:
+        ax.set_title(title.format(name=user_data['name'], id=user_id), color=text_color)
+
+    if show_values:
+        threshold = message_counts.max() / 2
+        for (day, hour), count in np.ndenumerate(message_counts):
+            ax.text(hour, day, count, ha='center', va='center', fontsize=7, color='white' if count > threshold else 'black')
+
+    if show_peak_hour and message_counts.any():
+        day, hour = np.unravel_index(message_counts.argmax(), message_counts.shape)
+        plt.figtext(0.5, 0.01, f"Peak Hour: {weekdays[day]} {hour:02d}:00 ({message_counts[day, hour]} messages)", ha='center', va='bottom', fontsize=10, color=text_color)
+
+    if SHOW_PLOTS:
+        plt.show()
+
+    if SAVE_PLOTS:
+        png_path = os.path.join(static_graphs_folder, "hourly_heatmap.png")
+        fig.savefig(png_path)
+        plt.close(fig)
+
+
 def create_category_histograms_animation(
     user_id, 
     user_data, 
@@ -783,6 +838,22 @@ def generate_data(user_stats):
             )
         
         
+        if GENERATE_HOURLY_HEATMAP:
+            create_hourly_heatmap(
+                user_id, 
+                user_data, 
+                static_graphs_folder,
+                figure_size=HEATMAP_PARAMS['FIGURE_SIZE'],
+                graph_background_color=HEATMAP_PARAMS['GRAPH_BACKGROUND_COLOR'],
+                text_color=HEATMAP_PARAMS['TEXT_COLOR'],
+                colormap=HEATMAP_PARAMS['COLORMAP'],
+                x_label=HEATMAP_PARAMS['X_LABEL'],
+                y_label=HEATMAP_PARAMS['Y_LABEL'],
+                title=HEATMAP_PARAMS['TITLE'],
+                show_values=HEATMAP_PARAMS['SHOW_VALUES'],
+                show_peak_hour=HEATMAP_PARAMS['SHOW_PEAK_HOUR']
+            )
+
         if GENERATE_CATEGORY_HISTOGRAM_GIFS:
             create_category_histograms_animation(
                 user_id, 
@@ -0,0 +1,77 @@
+"""
+Memory-bounded approximate word counting for collect_data.py, see `USER_WORD_COUNTER_CAPACITY` and `GLOBAL_WORD_COUNTER_CAPACITY`.
+
+A variant of the Space-Saving algorithm (Metwally et al., 2005) that evicts in batches: at most `capacity` words are counted, once
+there are more the least counted half is dropped. A word that is counted again after being dropped starts from `floor`, the highest
+count dropped so far, so the counts are never lower than the real ones and at most `floor` higher. The most frequent words are kept
+for sure, and the counts are exact as long as no more than `capacity` distinct words are seen.
+"""
+
+import heapq
+from collections import Counter
+from operator import itemgetter
+
+
+class SpaceSaving:
+    """Supports the parts of the Counter interface used for the word counters: `update()`, `most_common()` and `len()`."""
+
+    def __init__(self, capacity: int):
+        if capacity < 2:
+            raise ValueError(f'The capacity of a word counter must be at least 2, got {capacity}.')
+
+        self.capacity = capacity
+        self.counts = Counter()
+        self.floor = 0  # No count is more than `floor` too high, and every word that is not counted occurred at most `floor` times.
+
+    def update(self, words):
+        """Counts an iterable of words, or adds the counts of another `SpaceSaving` collected from other messages."""
+        if isinstance(words, SpaceSaving):
+            self.merge(words)
+
+        elif not self.floor:
+            self.counts.update(words)
+
+        else:
+            counts = self.counts
+            floor = self.floor
+            for word in words:
+                counts[word] = counts.get(word, floor) + 1
+
+        if len(self.counts) > self.capacity:
+            self.prune()
+
+    def merge(self, other: 'SpaceSaving'):
+        counts = self.counts
+        floor = self.floor
+
+        for word, count in other.counts.items():
+            counts[word] = counts.get(word, floor) + count
+
+        # The words that only `self` counted may have occurred up to `other.floor` times in the other messages.
+        if other.floor:
+            for word in counts.keys() - other.counts.keys():
+                counts[word] += other.floor
+
+        self.floor += other.floor
+
+    def prune(self):
+        """Keeps the `capacity // 2` most counted words."""
+        kept = {word for word, _ in heapq.nlargest(self.capacity // 2, self.counts.items(), key=itemgetter(1))}
+
+        dropped = max(count for word, count in self.counts.items() if word not in kept)
+        self.floor = max(self.floor, dropped)
+        self.counts = Counter({word: count for word, count in self.counts.items() if word in kept})
+
+    def remap(self, mapping):
+        """Replaces every word with `mapping[word]`, used to move counted word ids to another vocabulary."""
+        self.counts = Counter({mapping[word]: count for word, count in self.counts.items()})
+
+    def error_bound(self) -> int:
+        """How much higher than the real ones the counts can be, 0 when they are exact."""
+        return self.floor
+
+    def most_common(self, n: int = None) -> list:
+        return self.counts.most_common(n)
+
+    def __len__(self):
+        return len(self.counts)
@@ -0,0 +1,128 @@
+"""
+A fast, offline emotion scorer used by collect_data.py when `SENTIMENT_BACKEND = 'lexicon'`.
+
+Words, emoticons and emojis are looked up in a small built-in emotion lexicon. Negated words ("not happy") are ignored, intensifiers
+("very", "so", ...) and exclamation marks increase the weight of the next match. The scores have the same labels as the default
+transformers model (anger, disgust, fear, joy, neutral, sadness, surprise) and add up to 1, a message without any emotion words is neutral.
+
+It is much less accurate than a transformers model, but scores millions of messages per minute on a single core.
+"""
+
+import re
+
+
+LABELS = ('anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise')
+
+LEXICON = {
+    'anger': (
+        'angry anger mad furious rage raging annoyed annoying annoy irritated irritating hate hated hating hateful pissed outraged outrage '
+        'livid fuming hostile resent bitter infuriating infuriated frustrated frustrating frustration stupid idiot idiots shut damn wtf '
+        'screw ugh grr argh insult insulted 😠 😡 🤬 👿 💢'
+    ),
+    'disgust': (
+        'disgust disgusting disgusted gross nasty eww ew yuck yucky vile revolting repulsive sick sickening nauseating filthy creepy '
+        'awful horrible cringe cringy cringey rotten foul 🤮 🤢 💩'
+    ),
+    'fear': (
+        'afraid fear scared scary scare frightened frightening terrified terrifying terror panic panicking nervous anxious anxiety worried '
+        'worry worrying dread horror horrified creepy threat threatening danger dangerous risky alarmed unsafe 😨 😰 😱 😟'
+    ),
+    'joy': (
+        'happy happiness glad joy joyful love loved lovely loving like liked great good nice awesome amazing wonderful fantastic excellent '
+        'perfect best beautiful cool fun funny enjoy enjoyed yay yes thanks thank thx congrats congratulations excited exciting lol lmao '
+        'haha hahaha hehe xd cute sweet brilliant proud win won celebrate delighted pleased :) :-) :d :-d :p <3 '
+        '😀 😃 😄 😁 😆 😂 🤣 😊 😍 🥰 😘 😎 🥳 🎉 👍 ❤ 💕 💖 😻 🙂'
+    ),
+    'sadness': (
+        'sad sadness unhappy depressed depressing depression cry crying cried tears lonely alone miss missed missing sorry heartbroken hurt '
+        'hurts pain painful grief grieving upset disappointed disappointing disappointment unfortunately regret lost lose loss sigh tired '
+        'hopeless broken rip :( :-( 😢 😭 😞 😔 ☹ 🙁 😿 💔'
+    ),
+    'surprise': (
+        'surprise surprised surprising wow whoa woah omg omfg unexpected unbelievable shocked shocking shock amazed astonished incredible '
+        'seriously suddenly 😮 😯 😲 😳 🤯 😱'
+    ),
+}
+
+NEGATION_SCOPE = 3  # Number of words after a negation that it applies to.
+NEGATIONS = frozenset('not no never dont don\'t cant can\'t wont won\'t isnt isn\'t arent aren\'t wasnt wasn\'t nothing nobody neither nor hardly'.split())
+INTENSIFIERS = frozenset('very so really too extremely super totally absolutely truly incredibly quite'.split())
+
+TOKEN_PATTERN = re.compile(r":-?[()dp]|<3|[\w']+|[^\w\s]")
+SUFFIXES = ('ing', 'ed', 'es', 's', 'ly')
+
+
+class LexiconSentiment:
+    VERSION = 1  # Part of the cache key, increase it when the lexicon or the scoring changes.
+
+    def __init__(self, lexicon: dict = LEXICON, neutral_weight=1.0, intensifier_weight=1.5):
+        self.neutral_weight = neutral_weight
+        self.intensifier_weight = intensifier_weight
+        self.words = {}
+        self.lookups = {}  # token -> labels, remembers the suffix lookups of every token seen so far.
+
+        for label, words in lexicon.items():
+            for word in (words.split() if isinstance(words, str) else words):
+                self.words.setdefault(word.lower(), []).append(label)
+
+    def lookup(self, token):
+        if token in self.lookups:
+            return self.lookups[token]
+
+        labels = self.words.get(token)
+        if labels is None:
+            for suffix in SUFFIXES:
+                if token.endswith(suffix) and len(token) > len(suffix) + 2:
+                    labels = self.words.get(token[:-len(suffix)])
+                    if labels is not None:
+                        break
+
+        self.lookups[token] = labels
+        return labels
+
+    def score(self, text: str) -> dict:
+        """Returns `{label: score}` for every label, the scores add up to 1."""
+        weights = dict.fromkeys(LABELS, 0.0)
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        negated = 0  # Number of words the last negation still applies to.
+        weight = 1.0
+
+        for i, token in enumerate(tokens):
+            if token in NEGATIONS:
+                negated = NEGATION_SCOPE
+                continue
+
+            if token in INTENSIFIERS:
+                weight *= self.intensifier_weight
+                continue
+
+            labels = self.lookup(token)
+            if labels is None:
+                # Punctuation ends the scope of a negation, other words are skipped over ("not that happy").
+                if not token[0].isalnum() and token != '!':
+                    negated = 0
+                    weight = 1.0
+
+                else:
+                    negated = max(negated - 1, 0)
+
+                continue
+
+            if not negated:
+                exclamations = 0
+                while i + 1 + exclamations < len(tokens) and tokens[i + 1 + exclamations] == '!':
+                    exclamations += 1
+
+                for label in labels:
+                    weights[label] += weight * (1 + 0.25 * min(exclamations, 3)) / len(labels)
+
+            negated = 0
+            weight = 1.0
+
+        weights['neutral'] += self.neutral_weight
+        total = sum(weights.values())
+
+        return {label: value / total for label, value in weights.items()}
+
+    def __call__(self, texts: list) -> list:
+        return [self.score(text) for text in texts]
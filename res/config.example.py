@@ -6,8 +6,9 @@ Create a `config.py` file in this directory or change the name of this file to `
 - The first set of variables are for the Telegram API configuration, which are required for the script to work. 
 - The second set contains flags that can be toggled to change the behavior of the script. 
 - The third set contains limits for the number of words, reactions, categories, etc., that are stored in the db and json files.
-- The fourth set contains sentiment analysis configuration.
-- The fifth set contains file paths for the data files generated by the script.
+- The fourth set contains database and fetching options for `fetch_group.py`.
+- The fifth set contains sentiment analysis configuration.
+- The sixth set contains file paths for the data files generated by the script.
 """
 
 
@@ -39,6 +40,8 @@ IGNORE_COMMON_WORDS = False  # Set to True to ignore the words found in res/phra
 IGNORE_URLS = False  # Replaces URLs with a white space ' '.
 GET_CHANNEL_LOG = True  # Set to True to get the log of the chat as a text file.
 SHOW_DATE = False  # Set to True to show the date of the messages in the log file.
+CHANNEL_LOG_COMPRESSION = None  # None, 'gzip' or 'zstd' (requires the zstandard module). Adds .gz or .zst to the name of the log file.
+INCREMENTAL_CHANNEL_LOG = False  # Set to True to only append the messages that are not in the log yet instead of rewriting it on every run of collect_data.py.
 SHOW_PROGRESS_BAR = True
 COUNT_REACTIONS = True
 LOGOUT = False  # Set to True to delete the session file after running the script, you would need to authenticate Telegram again.
@@ -46,6 +49,9 @@ CALCULATE_USER_RATIOS = True  # Set to True to calculate the ratio of words/reac
 CALCULATE_GLOBAL_RATIOS = True  # Same as above, but for global statistics.
 GLOBAL_RANKING_BY_RATIO = False  # Set to False to rank users by total count instead of ratio. Applies to all categories. (e.g., active days, media count, etc.)
 TRIM_OUTLIERS = False  # Set to True to trim users with messages/active days out of the bounds below. Currently only affects the global rankings.
+INCREMENTAL_COLLECT = False  # Set to True to save the collected stats after each run and only process the new messages on the next one. Changing any counting option starts over.
+NUMERIC_ONLY = False  # Set to True to only count messages, media, active days and reactions without reading the texts. Much faster, words, categories, sentiments and the channel log are skipped.
+COMPACT_JSON = False  # Set to True to save user_stats.json and global_stats.json without indentation. Much smaller files, but harder to read.
 
 
 # Limits
@@ -62,14 +68,32 @@ GLOBAL_CATEGORY_LIMIT = 1000  # Limit for top category mentions (see phrases.py)
 GLOBAL_RANKING_LIMIT = 100  # Limit for global ranking data (e.g., top users by active days, by media count, etc.)
 GLOBAL_ACTIVE_DAYS_LIMIT = 365  # Limit for top global active days.
 
+# Set to a number of distinct words to count the top words approximately with a bounded amount of memory, None to count every word exactly.
+# The counts stay exact while no more words are seen, otherwise they can be too high by at most `top_words_error_bound` (saved in the json files).
+# Use at least twice the word limit above, larger values are more accurate.
+USER_WORD_COUNTER_CAPACITY = None  # Per user, e.g. 10000.
+GLOBAL_WORD_COUNTER_CAPACITY = None  # For the whole group, e.g. 100000.
+
 OUTLIER_MIN_MESSAGES = 0
 OUTLIER_MAX_MESSAGES = 10**5
 OUTLIER_MIN_ACTIVE_DAYS = 0
 OUTLIER_MAX_ACTIVE_DAYS = 365*10
 
 
-# Sentiment Analysis [EXPERIMENTAL]: Requires the `transformers` library, along with the `torch` or `tensorflow`.
-# If enabled, the program will take a significantally longer time to run.
+# Database & Fetching
+SQLITE_JOURNAL_MODE = 'WAL'  # 'WAL' lets fetching and reading run at the same time and avoids rewriting the whole journal on every commit. 'DELETE' is the SQLite default.
+SQLITE_SYNCHRONOUS = 'NORMAL'  # 'OFF', 'NORMAL' or 'FULL'. With WAL, 'NORMAL' only risks losing the last transaction on a power failure, never corrupting the db.
+COMMIT_EVERY_PAGES = 5  # Number of fetched pages (up to 100 messages each) written to messages.db per transaction.
+FETCH_QUEUE_SIZE = 10  # Maximum number of fetched pages waiting to be written. Fetching pauses while the queue is full.
+READ_CHUNK_SIZE = 10000  # Number of rows read from messages.db at a time by collect_data.py.
+FETCH_MIN_BATCH_SIZE = 10  # Smallest page size the fetcher falls back to after being rate limited (FloodWait).
+FETCH_MAX_BATCH_SIZE = 100  # Largest page size, 100 is the maximum allowed by the Telegram API for a single request.
+FETCH_PARALLEL_RANGES = 1  # Split the missing history into this many id ranges and fetch them concurrently. Interrupted ranges are resumed on the next run.
+COLLECT_WORKERS = 1  # Number of processes used by collect_data.py. Above 1, messages.db is split into shards by message id and the partial stats are merged, with the same results.
+
+
+# Sentiment Analysis [EXPERIMENTAL]: The default backend requires the `transformers` library, along with the `torch` or `tensorflow`.
+# If enabled with that backend, the program will take a significantally longer time to run. Scores are cached in `sentiment_cache_db`, so messages analyzed by a previous run are not analyzed again.
 # Example output: 
 """
 {
@@ -111,12 +135,15 @@ OUTLIER_MAX_ACTIVE_DAYS = 365*10
 """
 
 ANALYZE_SENTIMENTS = False
+SENTIMENT_BACKEND = 'transformers'  # 'transformers' runs the pipeline below. 'lexicon' uses a fast built-in word list (lexicon_sentiment.py) that needs no extra library, with the same labels but far less accurate.
 SENTIMENT_PIPELINE_ARGS = ('text-classification', )
 SENTIMENT_PIPELINE_KWARGS = {
     'model': 'j-hartmann/emotion-english-distilroberta-base',
     'top_k': None,
     'truncation': True
 }
+SENTIMENT_BATCH_SIZE = 32  # Number of messages scored by the pipeline in a single call. Larger batches are faster, especially on a GPU, but use more memory.
+SENTIMENT_WORKERS = 0  # Number of background processes scoring the batches while the messages keep being counted. Each one loads its own copy of the model. 0 scores them in the main process. Not used when COLLECT_WORKERS is above 1.
 # Example filter for the dominant sentiment. If the score is less than 0.30, that message will not be classified as having a dominant sentiment.
 # The overall ratio calculation is not affected by this filter.
 dominant_sentiment_filter = lambda label, score: score >= 0.30
@@ -125,6 +152,8 @@ dominant_sentiment_filter = lambda label, score: score >= 0.30
 # File paths for collect_data.py
 user_stats_json = f'{output_folder}/user_stats.json'
 user_stats_db = f'{output_folder}/users.db'
+collect_state_file = f'{output_folder}/collect_state.pkl'  # Used when INCREMENTAL_COLLECT is enabled.
+sentiment_cache_db = f'{output_folder}/sentiment_cache.db'  # Used when ANALYZE_SENTIMENTS is enabled.
 
 
 # File paths for fetch_group.py
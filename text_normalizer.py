@@ -0,0 +1,63 @@
+"""
+Normalizes message texts before they are logged and counted, shared by collect_data.py, get_all_words.py and the wordcloud extension.
+
+Every pattern is compiled once and accents are removed with a single `str.translate` table instead of one regex pass per letter.
+`unidecode` transliterates one character at a time, so texts are transliterated word by word and every word is memoized:
+chat vocabularies repeat heavily and most words are only converted once.
+"""
+
+import re
+from functools import lru_cache
+
+
+URL_PATTERN = re.compile(r'http\S+')
+MENTION_PATTERN = re.compile(r'\[(.*?)\]\(tg://user\?id=(\d+)\)')  # [name](tg://user?id=id)
+WHITESPACE_SPLIT_PATTERN = re.compile(r'(\s+)')
+
+
+def accent_table(accented_chars: dict) -> dict:
+    """Builds a `str.translate` table from `{letter: accented letters}`, such as `ACCENTED_CHARS` in the config."""
+    table = {}
+
+    for letter, accents in accented_chars.items():
+        for accent in accents:
+            table.setdefault(ord(accent), letter)
+
+    return table
+
+
+class TextNormalizer:
+    def __init__(self, convert_unicode=False, ignore_urls=False, accented_chars=None, cache_size=2**16):
+        self.convert_unicode = convert_unicode
+        self.ignore_urls = ignore_urls
+        self.accents = accent_table(accented_chars) if accented_chars else None
+
+        if convert_unicode:
+            from unidecode import unidecode
+            self.unidecode = lru_cache(maxsize=cache_size)(unidecode)
+
+    def transliterate(self, text: str) -> str:
+        """Converts the text to ASCII with `convert_unicode`, otherwise replaces the characters that can not be encoded."""
+        if not self.convert_unicode:
+            return text.encode('utf-8', errors='replace').decode('utf-8')
+
+        if text.isascii():
+            return text
+
+        return ''.join(map(self.unidecode, WHITESPACE_SPLIT_PATTERN.split(text)))
+
+    def remove_accents(self, text: str) -> str:
+        return text.translate(self.accents) if self.accents else text
+
+    def clean(self, text: str) -> str:
+        """Removes the URLs and accents, and replaces the mentions with the mentioned names."""
+        if self.ignore_urls:
+            text = URL_PATTERN.sub(' ', text)
+
+        if self.accents:
+            text = text.translate(self.accents)
+
+        if '](tg://user?id=' in text:
+            text = MENTION_PATTERN.sub(r'\1', text)
+
+        return text
@@ -0,0 +1,121 @@
+"""
+Splits message texts into words for collect_data.py and get_all_words.py.
+
+A word is a run of word characters, the same as `re.findall(r'\b\w+\b', text)`. `Tokenizer.tokenize` filters, counts and
+normalizes the words of a message in a single pass, `Tokenizer.count` counts the words of many messages with one regex call.
+
+Run `python tokenizer.py` for a micro-benchmark of the per-message cost.
+"""
+
+import re
+from collections import Counter, namedtuple
+
+
+WORD_PATTERN = re.compile(r'\w+')
+
+Tokens = namedtuple('Tokens', ('words', 'word_count', 'letter_count', 'loud_word_count'))
+
+
+class Tokenizer:
+    """
+    Words shorter than `min_length` are skipped entirely. The others are counted in `word_count`, `letter_count` and `loud_word_count`
+    (all uppercase), then lowercased if `lower` and dropped from `words` if they are in `ignored`.
+    """
+
+    def __init__(self, min_length=1, lower=False, ignored=frozenset()):
+        self.min_length = min_length
+        self.lower = lower
+        self.ignored = frozenset(ignored)
+
+    def tokenize(self, text: str) -> Tokens:
+        min_length = self.min_length
+        lower = self.lower
+        ignored = self.ignored
+
+        words = []
+        word_count = letter_count = loud_word_count = 0
+
+        for word in WORD_PATTERN.findall(text):
+            length = len(word)
+            if length < min_length:
+                continue
+
+            word_count += 1
+            letter_count += length
+
+            if word.isupper():
+                loud_word_count += 1
+
+            if lower:
+                word = word.lower()
+
+            if word not in ignored:
+                words.append(word)
+
+        return Tokens(words, word_count, letter_count, loud_word_count)
+
+    def count(self, texts: list) -> Counter:
+        """Batched mode, returns the `words` of all `texts` in a single Counter."""
+        # Words never span a line break, so the texts can be matched as one string.
+        counter = Counter(WORD_PATTERN.findall('\n'.join(texts)))
+
+        if self.min_length <= 1 and not self.lower and not self.ignored:
+            return counter
+
+        # Filtering the distinct words is much cheaper than filtering every occurrence.
+        words = Counter()
+        for word, count in counter.items():
+            if len(word) < self.min_length:
+                continue
+
+            if self.lower:
+                word = word.lower()
+
+            if word not in self.ignored:
+                words[word] += count
+
+        return words
+
+
+def tokenize_with_regex(text: str, min_length=1, lower=False, ignored=frozenset()) -> Tokens:
+    """The previous implementation of `Tokenizer.tokenize`, kept as the baseline of the benchmark."""
+    words = [word for word in re.findall(r'\b\w+\b', text) if len(word) >= min_length]
+    word_count = len(words)
+    letter_count = sum(len(word) for word in words)
+    loud_word_count = len([word for word in words if word.isupper()])
+
+    if lower:
+        words = [word.lower() for word in words]
+
+    words = [word for word in words if word not in ignored]
+
+    return Tokens(words, word_count, letter_count, loud_word_count)
+
+
+if __name__ == '__main__':
+    import timeit
+    import argparse
+    from fake_telegram import generate_messages
+
+    parser = argparse.ArgumentParser(description='Measures the per-message cost of tokenizing synthetic messages.')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--min-length', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    texts = [message.text for message in generate_messages(args.messages) if message.text]
+    ignored = frozenset(('the', 'be', 'to', 'of', 'and', 'a', 'in'))
+    tokenizer = Tokenizer(args.min_length, True, ignored)
+
+    assert all(tokenizer.tokenize(text) == tokenize_with_regex(text, args.min_length, True, ignored) for text in texts)
+    assert tokenizer.count(texts) == Counter(word for text in texts for word in tokenizer.tokenize(text).words)
+
+    benchmarks = {
+        're.findall + list comprehensions': lambda: [tokenize_with_regex(text, args.min_length, True, ignored) for text in texts],
+        'Tokenizer.tokenize': lambda: [tokenizer.tokenize(text) for text in texts],
+        'Tokenizer.count (batched)': lambda: tokenizer.count(texts),
+    }
+
+    for name, benchmark in benchmarks.items():
+        elapsed = min(timeit.repeat(benchmark, number=3, repeat=args.repeat)) / 3
+        print(f'{name:<35} {elapsed / len(texts) * 1e6:6.2f} us/message')
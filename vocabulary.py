@@ -0,0 +1,107 @@
+"""
+Word counting for collect_data.py with every word stored once.
+
+`Vocabulary` gives each distinct word an integer id in the order the words are first seen. The word counters of the users and the group
+only hold these ids, in `WordCounts` (or `SpaceSaving` when a capacity is set), and the words are looked up again when the stats are saved.
+"""
+
+import numpy as np
+from array import array
+
+
+class Vocabulary:
+    def __init__(self):
+        self.words = []  # id -> word
+        self.ids = {}  # word -> id
+
+    def add(self, word: str) -> int:
+        self.ids[word] = word_id = len(self.words)
+        self.words.append(word)
+
+        return word_id
+
+    def encode(self, words) -> list:
+        ids = self.ids
+        return [ids[word] if word in ids else self.add(word) for word in words]
+
+    def merge(self, other: 'Vocabulary') -> list:
+        """Adds the words of `other`, returns the ids of its words in this vocabulary indexed by their ids in `other`."""
+        return self.encode(other.words)
+
+    def to_words(self, counts) -> dict:
+        """Turns `(id, count)` pairs, such as `WordCounts.most_common()`, into `{word: count}`."""
+        words = self.words
+        return {words[word_id]: count for word_id, count in counts}
+
+    def __len__(self):
+        return len(self.words)
+
+
+class WordCounts:
+    """
+    A Counter of word ids backed by two int32 arrays, `counts[i]` occurrences of `ids[i]` in the order the ids were first counted.
+    New ids are buffered in `pending` and added in batches. Supports `update()`, `most_common()` and `len()` like a Counter.
+    """
+
+    __slots__ = ('ids', 'counts', 'pending')
+
+    MIN_PENDING = 1024  # The buffer is added once it holds more ids than this and than the counter itself.
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.counts = np.zeros(0, dtype=np.int32)
+        self.pending = array('i')
+
+    def update(self, ids):
+        """Counts an iterable of ids, or adds the counts of another `WordCounts`."""
+        if isinstance(ids, WordCounts):
+            ids.flush()
+            self.add(ids.ids, ids.counts)
+            return
+
+        self.pending.extend(ids)
+
+        if len(self.pending) > max(self.MIN_PENDING, len(self.ids)):
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        pending = np.array(self.pending, dtype=np.int32)
+        self.pending = array('i')
+
+        ids, first, counts = np.unique(pending, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        self.add(ids[order], counts[order].astype(np.int32))
+
+    def add(self, ids: np.ndarray, counts: np.ndarray):
+        """Adds `counts[i]` occurrences of `ids[i]`, the ids must be unique. New ids are appended in the given order."""
+        if not len(self.ids):
+            self.ids = ids.copy()
+            self.counts = counts.copy()
+            return
+
+        order = np.argsort(self.ids)
+        index = order[np.minimum(np.searchsorted(self.ids, ids, sorter=order), len(order) - 1)]
+        found = self.ids[index] == ids
+
+        self.counts[index[found]] += counts[found]
+        self.ids = np.concatenate((self.ids, ids[~found]))
+        self.counts = np.concatenate((self.counts, counts[~found]))
+
+    def remap(self, mapping: list):
+        """Replaces every id with `mapping[id]`, used to move counts to another vocabulary."""
+        self.flush()
+        self.ids = np.array([mapping[word_id] for word_id in self.ids.tolist()], dtype=np.int32)
+
+    def most_common(self, n: int = None) -> list:
+        """Returns `(id, count)` pairs, the most counted first and the first counted first on ties, like `Counter.most_common`."""
+        self.flush()
+        order = np.argsort(-self.counts, kind='stable')[:n]
+
+        return list(zip(self.ids[order].tolist(), self.counts[order].tolist()))
+
+    def __len__(self):
+        self.flush()
+        return len(self.ids)
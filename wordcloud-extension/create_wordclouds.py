@@ -1,13 +1,18 @@
 import os
+import sys
 import shutil
 import json
-import re
 import wordcloud
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
 from config import *
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_normalizer import TextNormalizer
+
+text_normalizer = TextNormalizer(accented_chars=ACCENTED_CHARS)
+
 
 def create_wordcloud(words, title, filepath, max_words=WORD_COUNT):
     mask = np.array(Image.open(MASK)) if MASK else None
@@ -45,11 +50,10 @@ def process_user_data(user_data):
     user_name = user_data["name"]
 
     if REMOVE_ACCENTS_IN_WORDS:
-        user_data = {key: {word.translate(str.maketrans(ACCENTED_CHARS)) if isinstance(word, str) else word: count for word, count in data.items()} for key, data in user_data.items()}
+        user_data = {key: {text_normalizer.remove_accents(word) if isinstance(word, str) else word: count for word, count in data.items()} if isinstance(data, dict) else data for key, data in user_data.items()}
 
     if REMOVE_ACCENTS_IN_FILENAMES:
-        for letter, accents in ACCENTED_CHARS.items():
-            user_name = re.sub(f'[{accents}]', letter, user_name)
+        user_name = text_normalizer.remove_accents(user_name)
 
     user_name = user_name.replace(" ", "_").lower() + (f"_{id}" if IDS_IN_FILENAMES else "")
     user_folder = os.path.join(output_folder, user_name) 